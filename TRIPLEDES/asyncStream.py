@@ -0,0 +1,57 @@
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+
+async def crypt_chunks(context, reader, chunk_size=DEFAULT_CHUNK_SIZE, executor=None):
+    """ Async generator feeding an asyncio.StreamReader through a streaming
+        context and yielding its output chunk by chunk. At most 'chunk_size'
+        bytes are read at a time and the block work runs on 'executor' (the
+        loop's default executor if None), while the next chunk is read, so
+        the event loop is never blocked by the cipher. Empty outputs are not
+        yielded.
+    """
+    # asyncio is imported here so that importing cui_des stays fast
+    import asyncio
+    if chunk_size <= 0:
+        raise ValueError("Chunk size must be positive")
+    loop = asyncio.get_running_loop()
+    chunk = await reader.read(chunk_size)
+    while chunk:
+        # Calls on a context are sequential; only reading overlaps with them
+        pending = loop.run_in_executor(executor, context.update, chunk)
+        try:
+            chunk = await reader.read(chunk_size)
+        finally:
+            out = await pending
+        if out:
+            yield out
+    out = await loop.run_in_executor(executor, context.finalize)
+    if out:
+        yield out
+
+
+class _CountingReader:
+    """ Wraps a StreamReader and counts the bytes read through it. """
+
+    def __init__(self, reader):
+        self._reader = reader
+        self.count = 0
+
+    async def read(self, n):
+        data = await self._reader.read(n)
+        self.count += len(data)
+        return data
+
+
+async def crypt_stream(context, reader, writer, chunk_size=DEFAULT_CHUNK_SIZE, executor=None):
+    """ Pipes 'reader' through a streaming context into the asyncio
+        StreamWriter 'writer', awaiting writer.drain() after every chunk so a
+        slow peer applies backpressure instead of letting output pile up.
+        Returns a tuple (bytes read, bytes written). The writer is not
+        closed. """
+    counting = _CountingReader(reader)
+    written = 0
+    async for out in crypt_chunks(context, counting, chunk_size, executor):
+        writer.write(out)
+        written += len(out)
+        await writer.drain()
+    return counting.count, written
@@ -0,0 +1,81 @@
+from intCore import _IntCore
+
+_core = _IntCore()
+
+
+def _lane_keys(keys, blocks, nkeys):
+    """ Builds one key stream per DES key of the cipher, repeating the key of
+        every message once per block of it. """
+    return [b''.join(key[8 * j:8 * j + 8] * (len(block) // 8) for key, block in zip(keys, blocks))
+            for j in range(nkeys)]
+
+
+def _split(data, lengths):
+    out = []
+    offset = 0
+    for length in lengths:
+        out.append(data[offset:offset + length])
+        offset += length
+    return out
+
+
+def crypt_many(keys, messages, mode="ECB", ivs=None, nkeys=1, decrypt=False):
+    """ Encrypts or decrypts messages[i] under keys[i] for every i in one
+        batched pass and returns the list of results.
+          keys     - one key per message, 8 * nkeys bytes each
+          messages - bytes-like messages of any length
+          mode     - "ECB" or "CBC" (padded like encrypt()) or "CTR"
+          ivs      - one 8-byte IV (initial counter block in CTR mode) per
+                     message, for CBC and CTR
+          nkeys    - 1 for DES, 3 for Triple-DES
+          decrypt  - True to decrypt
+    """
+    if len(keys) != len(messages):
+        raise ValueError("There must be one key per message")
+    keys = [bytes(_core._as_buffer(key)) for key in keys]
+    if nkeys == 3:
+        # Two-key Triple-DES reuses the first key as the third
+        keys = [key + key[:8] if len(key) == 16 else key for key in keys]
+    for key in keys:
+        if len(key) != 8 * nkeys:
+            raise ValueError("Keys must be %d bytes long" % (8 * nkeys))
+    messages = [_core._as_buffer(message) for message in messages]
+    if mode == "ECB":
+        if decrypt:
+            if any(len(message) % 8 != 0 for message in messages):
+                raise ValueError("Ciphertext length must be a multiple of 8 bytes")
+            blocks = messages
+        else:
+            blocks = [_core._add_padding(message) for message in messages]
+        out = _core._keyed_ecb(b''.join(blocks), _lane_keys(keys, blocks, nkeys), decrypt)
+        out = _split(out, [len(block) for block in blocks])
+        return [_core._rem_padding(message) for message in out] if decrypt else out
+    if mode == "CBC":
+        if ivs is None or len(ivs) != len(messages):
+            raise ValueError("CBC mode needs one IV per message")
+        for iv in ivs:
+            _core._check_iv(iv)
+        if not decrypt:
+            padded = [_core._add_padding(message) for message in messages]
+            return _core._keyed_cbc_encrypt(padded, keys, ivs, nkeys)
+        if any(len(message) % 8 != 0 for message in messages):
+            raise ValueError("Ciphertext length must be a multiple of 8 bytes")
+        # Decryption has no chaining dependency: every block of every message
+        # is decrypted in one keyed batch, then XORed with the block before it
+        out = _core._keyed_ecb(b''.join(messages), _lane_keys(keys, messages, nkeys), True)
+        chained = b''.join(bytes(iv) + bytes(message[:-8]) for iv, message in zip(ivs, messages) if len(message))
+        out = _core._xor_bytes(out, chained)
+        return [_core._rem_padding(message) for message in _split(out, [len(message) for message in messages])]
+    if mode == "CTR":
+        if ivs is None or len(ivs) != len(messages):
+            raise ValueError("CTR mode needs one IV per message")
+        counters = []
+        for iv, message in zip(ivs, messages):
+            _core._check_iv(iv)
+            start = int.from_bytes(iv, byteorder='big')
+            counters.append(_core._from_blocks([(start + i) & 0xFFFFFFFFFFFFFFFF
+                                                for i in range((len(message) + 7) // 8)]))
+        keystream = _core._keyed_ecb(b''.join(counters), _lane_keys(keys, counters, nkeys))
+        keystreams = _split(keystream, [len(counter) for counter in counters])
+        return [_core._xor_bytes(message, ks) for message, ks in zip(messages, keystreams)]
+    raise ValueError("Invalid mode for a keyed batch: " + mode)
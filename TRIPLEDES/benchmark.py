@@ -0,0 +1,233 @@
+""" Reproducible benchmark suite for the DES and TDES wrappers.
+
+    python benchmark.py [--max-size BYTES] [--modes ECB CBC] [--output run.json]
+    python benchmark.py --compare old.json new.json
+    python benchmark.py --sessions 10000
+
+    Every combination of algorithm, mode, direction, payload size and engine
+    is timed until it has run for --min-time seconds (or --max-repeats
+    calls). Throughput, latency percentiles and the peak traced memory of one
+    extra call are written as JSON with sorted keys, so two runs can be
+    diffed or compared with --compare. --sessions measures instead how much
+    memory many live sessions take as cipher objects and as compact contexts.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from cui_des import DES, TDES, des_context, tdes_context, sizeof_session
+from intCore import _IntCore
+
+SIZES = [8, 64, 1 << 10, 1 << 16, 1 << 20, 1 << 26]
+MODES = ["ECB", "CBC", "OFB", "CTR"]
+ALGORITHMS = {"DES": (DES, 8), "TDES": (TDES, 24)}
+CONTEXTS = {"DES": des_context, "TDES": tdes_context}
+SEED = 1234
+
+
+def available_engines():
+    """ Returns the engine names that can run here. "auto" lets the registry
+        choose; the list-of-bits reference is left out as too slow. """
+    return ["auto"] + [name for name in _IntCore._registry.names() if name != "reference"]
+
+
+def _payload(size, seed=SEED):
+    """ Deterministic pseudo-random payload so runs are comparable. """
+    return random.Random(seed + size).randbytes(size)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _measure(func, data, min_time, max_repeats):
+    """ Calls func(data) until min_time seconds have passed or max_repeats
+        calls were made, and returns the list of per-call latencies. """
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < max_repeats:
+        t0 = time.perf_counter()
+        func(data)
+        latencies.append(time.perf_counter() - t0)
+        if time.perf_counter() - start >= min_time:
+            break
+    return latencies
+
+
+def _peak_memory(func, data):
+    """ Returns the peak memory traced by tracemalloc during one call. """
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        func(data)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_case(algorithm, mode, direction, size, engine, min_time=0.2, max_repeats=1000, memory=True):
+    """ Benchmarks one combination and returns its result dictionary. """
+    cls, key_size = ALGORITHMS[algorithm]
+    rng = random.Random(SEED)
+    key, iv = rng.randbytes(key_size), rng.randbytes(8)
+    cipher = cls(key, mode, iv, engine=None if engine == "auto" else engine)
+    data = _payload(size)
+    if direction == "decrypt":
+        data = cipher.encrypt(data)
+        func = cipher.decrypt
+    else:
+        func = cipher.encrypt
+    func(data)  # warm up caches and lazy imports
+    latencies = _measure(func, data, min_time, max_repeats)
+    median = _percentile(latencies, 0.5)
+    result = {
+        "algorithm": algorithm, "mode": mode, "direction": direction, "size": size, "engine": engine,
+        "calls": len(latencies),
+        "latency_s": {"min": min(latencies), "p50": median, "p90": _percentile(latencies, 0.9),
+                      "p99": _percentile(latencies, 0.99), "max": max(latencies)},
+        "throughput_mb_s": size / median / 1e6 if median > 0 else None,
+    }
+    if memory:
+        result["peak_memory_bytes"] = _peak_memory(func, data)
+    return result
+
+
+def _traced_per_object(factory, args):
+    """ Returns the bytes traced by tracemalloc per object while one object
+        per argument tuple is created and kept alive. """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [factory(*a) for a in args]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del objects
+    return (after - before) / len(args)
+
+
+def bench_sessions(algorithm, count=10000, mode="CBC"):
+    """ Measures the memory of 'count' live sessions with distinct keys,
+        kept as cipher objects and as compact contexts, and returns the
+        traced bytes per session of both and the sizes sizeof_session()
+        reports for one of each. """
+    cls, key_size = ALGORITHMS[algorithm]
+    rng = random.Random(SEED)
+    args = [(rng.randbytes(key_size), mode, rng.randbytes(8)) for _ in range(count)]
+    objects = _traced_per_object(cls, args)
+    contexts = _traced_per_object(CONTEXTS[algorithm], args)
+    return {
+        "algorithm": algorithm, "mode": mode, "sessions": count,
+        "object_bytes": objects, "context_bytes": contexts,
+        "object_sizeof": sizeof_session(cls(*args[0])),
+        "context_sizeof": sizeof_session(CONTEXTS[algorithm](*args[0])),
+        "reduction": 1 - contexts / objects if objects > 0 else None,
+    }
+
+
+def _case_id(result):
+    return "%(algorithm)s/%(mode)s/%(direction)s/%(engine)s/%(size)d" % result
+
+
+def run_benchmarks(algorithms=("DES", "TDES"), modes=MODES, sizes=SIZES, engines=None,
+                   min_time=0.2, max_repeats=1000, memory=True, progress=None):
+    """ Runs every combination and returns a JSON-serialisable report with the
+        environment and one entry per case. 'progress', if given, is called
+        with each result as it completes. """
+    engines = engines or available_engines()
+    results = []
+    for algorithm in algorithms:
+        for mode in modes:
+            for direction in ("encrypt", "decrypt"):
+                for engine in engines:
+                    for size in sizes:
+                        result = bench_case(algorithm, mode, direction, size, engine, min_time, max_repeats, memory)
+                        results.append(result)
+                        if progress:
+                            progress(result)
+    return {
+        "environment": {"python": platform.python_version(), "implementation": platform.python_implementation(),
+                        "platform": platform.platform(), "machine": platform.machine(), "seed": SEED},
+        "settings": {"min_time": min_time, "max_repeats": max_repeats},
+        "results": results,
+    }
+
+
+def compare_results(baseline, current, threshold=0.10):
+    """ Compares the median latencies of two reports and returns a list of
+        (case, baseline seconds, current seconds, ratio) for every case that
+        got slower by more than 'threshold'. """
+    previous = {_case_id(r): r["latency_s"]["p50"] for r in baseline["results"]}
+    slower = []
+    for result in current["results"]:
+        case = _case_id(result)
+        if case in previous and previous[case] > 0:
+            ratio = result["latency_s"]["p50"] / previous[case]
+            if ratio > 1 + threshold:
+                slower.append((case, previous[case], result["latency_s"]["p50"], ratio))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark DES and TDES throughput, latency and memory.")
+    parser.add_argument("--algorithms", nargs="+", default=list(ALGORITHMS), choices=list(ALGORITHMS))
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--engines", nargs="+", default=None, help="default: every available engine")
+    parser.add_argument("--sizes", nargs="+", type=int, default=None, help="payload sizes in bytes")
+    parser.add_argument("--max-size", type=int, default=1 << 20,
+                        help="skip default sizes above this (64 MiB runs take minutes per case)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds to time each case")
+    parser.add_argument("--max-repeats", type=int, default=1000)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak measurement")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="report cases whose median latency regressed between two JSON reports")
+    parser.add_argument("--threshold", type=float, default=0.10, help="regression threshold for --compare")
+    parser.add_argument("--sessions", type=int, metavar="N",
+                        help="only measure the memory of N live sessions, cipher objects against contexts")
+    args = parser.parse_args(argv)
+
+    if args.sessions:
+        report = {"sessions": [bench_sessions(algorithm, args.sessions) for algorithm in args.algorithms]}
+        text = json.dumps(report, indent=2, sort_keys=True)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        return 0
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        slower = compare_results(baseline, current, args.threshold)
+        for case, before, after, ratio in slower:
+            print("%-40s %.6f s -> %.6f s (x%.2f)" % (case, before, after, ratio))
+        return 1 if slower else 0
+
+    sizes = args.sizes or [size for size in SIZES if size <= args.max_size]
+
+    def progress(result):
+        print("%-40s %10.3f MB/s" % (_case_id(result), result["throughput_mb_s"] or 0), file=sys.stderr)
+
+    report = run_benchmarks(args.algorithms, args.modes, sizes, args.engines, args.min_time,
+                            args.max_repeats, not args.no_memory, progress)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
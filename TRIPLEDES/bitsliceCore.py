@@ -0,0 +1,247 @@
+from core import _Core
+
+
+def _sbox_gates(box, inputs, outputs, prefix):
+    """ Builds a boolean gate network for one S-BOX. 'inputs' are the names of
+        the six input bits (most significant first) and 'outputs' the names of
+        the four output bits. Returns a list of (dest, op, a, b) gates where op
+        is '^', '&' or '|'. The name 'm' is the all-ones lane mask, so x ^ m is
+        NOT x.
+    """
+    a, b, c, d, e, f = inputs
+    gates = []
+
+    def gate(name, op, x, y):
+        gates.append((prefix + name, op, x, y))
+        return prefix + name
+
+    na, nb, nc, nd, ne, nf = [gate('n' + str(i), '^', x, 'm') for i, x in enumerate(inputs)]
+    # Minterms of the column bit pairs (b, c) and (d, e)
+    bc = [gate('bc0', '&', nb, nc), gate('bc1', '&', nb, c), gate('bc2', '&', b, nc), gate('bc3', '&', b, c)]
+    de = [gate('de0', '&', nd, ne), gate('de1', '&', nd, e), gate('de2', '&', d, ne), gate('de3', '&', d, e)]
+    cols = [gate('c' + str(j), '&', bc[j >> 2], de[j & 3]) for j in range(16)]
+    # Minterms of the row bits (a, f)
+    rows = [gate('r0', '&', na, nf), gate('r1', '&', na, f), gate('r2', '&', a, nf), gate('r3', '&', a, f)]
+    for t, out in enumerate(outputs):
+        terms = []
+        for row in range(4):
+            # Every S-BOX row is a permutation of 0..15, so each output bit
+            # is set for exactly eight columns.
+            ones = [cols[col] for col in range(16) if (box[row][col] >> (3 - t)) & 1]
+            acc = ones[0]
+            for n, col in enumerate(ones[1:]):
+                acc = gate('o%d_%d_%d' % (t, row, n), '|', acc, col)
+            terms.append(gate('o%d_%d' % (t, row), '&', rows[row], acc))
+        acc = gate('y%d_0' % t, '|', terms[0], terms[1])
+        acc = gate('y%d_1' % t, '|', acc, terms[2])
+        gates.append((out, '|', acc, terms[3]))
+    return gates
+
+
+def _round_source(s_boxes, expand, contract):
+    """ Generates the source of the bitsliced round function. The function
+        takes the left and right halves and the round key as lists of lane
+        integers and returns the new right half. The E and P permutations are
+        just renamings of variables.
+    """
+    lines = ['def _bs_round(l, r, k, m):']
+    for j, src in enumerate(expand):
+        lines.append('    x%d = r[%d] ^ k[%d]' % (j, src, j))
+    for i, box in enumerate(s_boxes):
+        inputs = ['x%d' % (6 * i + n) for n in range(6)]
+        outputs = ['s%d' % (4 * i + t) for t in range(4)]
+        for dest, op, a, b in _sbox_gates(box, inputs, outputs, 'g%d_' % i):
+            lines.append('    %s = %s %s %s' % (dest, a, op, b))
+    lines.append('    return [%s]' % ', '.join('l[%d] ^ s%d' % (j, src) for j, src in enumerate(contract)))
+    return '\n'.join(lines) + '\n'
+
+
+def _load_round():
+    """ Returns the bitsliced round function, generated from the _Core tables
+        and compiled on first use. Only source built here from those tables
+        is ever compiled, never code read from a file. """
+    namespace = {}
+    exec(compile(_round_source(_Core._S_BOXES, _Core._EXPAND, _Core._CONTRACT), '<bitslice round>', 'exec'),
+         namespace)
+    return namespace['_bs_round']
+
+
+def _key_plane_sources():
+    """ Returns, for each of the 16 rounds, the index of the key bit (counted
+        from the most significant bit of the 64-bit key) that every one of the
+        48 subkey bits is taken from. PC-1, the rotations and PC-2 only move
+        bits around, so when every lane has its own key the round key planes
+        are just a selection of the key planes.
+    """
+    sources = []
+    shift = 0
+    for n in _Core._KEY_SHIFT:
+        shift += n
+        rotated = [half * 28 + (i + shift) % 28 for half in (0, 1) for i in range(28)]
+        sources.append([_Core._KEY_PERMUTATION1[rotated[p]] for p in _Core._KEY_PERMUTATION2])
+    return sources
+
+
+# Byte translation tables used to transpose blocks into bit planes and back
+_TO_BIT_CHARS = [bytes.maketrans(bytes(range(256)),
+                                 bytes(0x31 if (v >> (7 - t)) & 1 else 0x30 for v in range(256)))
+                 for t in range(8)]
+_FROM_BIT_CHARS = [bytes.maketrans(b'01', bytes([0, 1 << (7 - t)])) for t in range(8)]
+
+
+class _BitsliceCore(_Core):
+    """ Bitsliced DES engine. A batch of n blocks is transposed into 64 bit
+        planes, each an n-bit integer holding one bit position of every block,
+        so every gate of the S-BOX networks processes the whole batch at once.
+        Only independent blocks can be batched this way.
+    """
+
+    # Loaded on first use, so importing the engine costs nothing
+    _bs_round = None
+
+    # Blocks per pass. Python integers have no fixed word size, so wider
+    # passes amortise the interpreter overhead of each gate.
+    BATCH_BLOCKS = 4096
+
+    def _to_planes(self, data):
+        """ Transposes block aligned data into 64 bit planes. Lane i of every
+            plane belongs to block i, counted from the most significant bit.
+        """
+        to_chars = _TO_BIT_CHARS
+        planes = []
+        for k in range(8):
+            column = data[k::8]
+            for t in range(8):
+                planes.append(int(column.translate(to_chars[t]), 2))
+        return planes
+
+    def _from_planes(self, planes, nblocks):
+        """ Transposes 64 bit planes of 'nblocks' lanes back into bytes. """
+        from_chars = _FROM_BIT_CHARS
+        fmt = '0%db' % nblocks
+        out = bytearray(8 * nblocks)
+        for k in range(8):
+            column = 0
+            for t in range(8):
+                bits = format(planes[8 * k + t], fmt).encode('ascii')
+                column |= int.from_bytes(bits.translate(from_chars[t]), byteorder='big')
+            out[k::8] = column.to_bytes(nblocks, byteorder='big')
+        return bytes(out)
+
+    def _key_planes(self, subkeys, mask):
+        """ Expands 16 integer subkeys into bit planes where every lane uses the
+            same key: each plane is either all ones or all zeroes.
+        """
+        return [[mask if (key >> (47 - j)) & 1 else 0 for j in range(48)] for key in subkeys]
+
+    _KEY_SOURCES = _key_plane_sources()
+
+    def _lane_key_planes(self, key_planes, decrypt=False):
+        """ Derives the 16 rounds of 48 key planes from the 64 planes of a
+            different key per lane. The rounds are reversed to decrypt. """
+        rounds = [[key_planes[i] for i in source] for source in self._KEY_SOURCES]
+        return rounds[::-1] if decrypt else rounds
+
+    def _bs_crypt_planes(self, planes, stage_planes, mask):
+        """ Runs bit planes through one DES pass per stage of key planes. The
+            IP and FP permutations only rename planes; IP is applied before the
+            first pass and FP after the last, since the FP/IP pair between two
+            passes cancels out.
+        """
+        bs_round = _BitsliceCore._bs_round
+        if bs_round is None:
+            bs_round = _BitsliceCore._bs_round = _load_round()
+        block = [planes[i] for i in self.INIT_PERMUTATION]
+        left, right = block[:32], block[32:]
+        for round_keys in stage_planes:
+            for k in round_keys:
+                left, right = right, bs_round(left, right, k, mask)
+            left, right = right, left
+        block = left + right
+        return [block[i] for i in self.FINAL_PERMUTATION]
+
+    def _bs_crypt(self, data, stages):
+        """ Encrypts block aligned data with one DES pass per subkey list in
+            'stages', BATCH_BLOCKS blocks at a time. """
+        nblocks = len(data) // 8
+        batch = self.BATCH_BLOCKS
+        out = []
+        cached_mask = None
+        for start in range(0, nblocks, batch):
+            count = min(batch, nblocks - start)
+            mask = (1 << count) - 1
+            if mask != cached_mask:
+                stage_planes = [self._key_planes(subkeys, mask) for subkeys in stages]
+                cached_mask = mask
+            planes = self._to_planes(bytes(data[8 * start:8 * (start + count)]))
+            planes = self._bs_crypt_planes(planes, stage_planes, mask)
+            out.append(self._from_planes(planes, count))
+        return b''.join(out)
+
+    def _bs_crypt_keyed(self, data, stages):
+        """ Like _bs_crypt, but every block has its own key. 'stages' is a list
+            of (keys, decrypt) pairs, one per DES pass, where 'keys' holds one
+            8-byte key per block of 'data' and 'decrypt' selects the direction
+            of the pass. The key schedules of the whole batch are derived by
+            transposing the keys into planes and renaming them.
+        """
+        nblocks = len(data) // 8
+        batch = self.BATCH_BLOCKS
+        out = []
+        for start in range(0, nblocks, batch):
+            count = min(batch, nblocks - start)
+            lo, hi = 8 * start, 8 * (start + count)
+            stage_planes = [self._lane_key_planes(self._to_planes(bytes(keys[lo:hi])), decrypt)
+                            for keys, decrypt in stages]
+            planes = self._to_planes(bytes(data[lo:hi]))
+            planes = self._bs_crypt_planes(planes, stage_planes, (1 << count) - 1)
+            out.append(self._from_planes(planes, count))
+        return b''.join(out)
+
+    def _bs_cbc_keyed(self, streams, stages, ivs):
+        """ CBC-encrypts many independent streams in lockstep, one lane per
+            stream: step i encrypts block i of every stream that has one as a
+            single bitsliced batch, and the chaining values stay in bit
+            planes between steps. 'streams' are block aligned byte strings of
+            any lengths, 'ivs' one 8-byte IV per stream and 'stages' a list
+            of (keys, decrypt) pairs where 'keys' holds one 8-byte key per
+            stream. Returns the list of ciphertexts.
+        """
+        # Longest streams first, so the streams still running at any step are
+        # the leading lanes and finished ones are dropped from the low bits
+        order = sorted(range(len(streams)), key=lambda i: len(streams[i]), reverse=True)
+        out = [b''] * len(streams)
+        batch = self.BATCH_BLOCKS
+        for start in range(0, len(order), batch):
+            group = order[start:start + batch]
+            lengths = [len(streams[i]) // 8 for i in group]
+            width = len(group)
+            stage_planes = [self._lane_key_planes(self._to_planes(b''.join(bytes(keys[8 * i:8 * i + 8])
+                                                                            for i in group)), decrypt)
+                            for keys, decrypt in stages]
+            prev = self._to_planes(b''.join(bytes(ivs[i]) for i in group))
+            results = [[] for _ in group]
+            step = 0
+            while True:
+                active = width
+                while active and lengths[active - 1] <= step:
+                    active -= 1
+                if active == 0:
+                    break
+                if active != width:
+                    shift = width - active
+                    prev = [plane >> shift for plane in prev]
+                    stage_planes = [[[plane >> shift for plane in round_keys] for round_keys in rounds]
+                                    for rounds in stage_planes]
+                    width = active
+                offset = 8 * step
+                planes = self._to_planes(b''.join(streams[i][offset:offset + 8] for i in group[:width]))
+                planes = [p ^ c for p, c in zip(planes, prev)]
+                prev = self._bs_crypt_planes(planes, stage_planes, (1 << width) - 1)
+                blocks = self._from_planes(prev, width)
+                for lane in range(width):
+                    results[lane].append(blocks[8 * lane:8 * lane + 8])
+                step += 1
+            for lane, i in enumerate(group):
+                out[i] = b''.join(results[lane])
+        return out
@@ -0,0 +1,322 @@
+""" Seekable encrypted container for large payloads.
+
+    The payload is cut into fixed-size chunks that are encrypted on their
+    own, in CTR mode or in CBC mode with a padded last block. CBC chunks get
+    a fresh random IV each. CTR chunks get consecutive counter ranges that
+    start at a random per-container nonce, chunk i at nonce + i * (chunk size
+    / 8), so no two chunks of a container share keystream. A trailing index records where every chunk is stored,
+    so read(offset, length) decrypts only the chunks it touches. Batches of
+    chunks are encrypted and decrypted on a process pool: the integer and
+    bitsliced engines hold the GIL, so threads would run them one at a time.
+
+        header   magic, version, DES stages (1 or 3), mode, chunk size
+        chunks   ciphertext of every chunk, in order
+        index    per chunk: file offset, stored length, plain length, IV
+        footer   index offset, chunk count, payload length, index CRC-32, magic
+"""
+import os
+import struct
+import threading
+import zlib
+from functools import partial
+
+from intCore import _IntCore
+
+MAGIC = b'CUIDESCT'
+CONTAINER_VERSION = 1
+DEFAULT_CHUNK_SIZE = 1 << 20
+MODES = {"CTR": 0, "CBC": 1}
+
+_HEADER = struct.Struct('<8sHBBI')
+_ENTRY = struct.Struct('<QII8s')
+_FOOTER = struct.Struct('<QIQI8s')
+
+
+_core = _IntCore()
+
+
+def _crypt_chunk(schedule, engine, mode, decrypt, data, iv):
+    """ Encrypts or decrypts one chunk. A module function taking the key
+        schedule, so that it can be sent to worker processes. """
+    if decrypt:
+        return _core._decrypt_mode(mode, data, schedule, iv, engine)
+    return _core._encrypt_mode(mode, data, schedule, iv, engine)
+
+
+class _ChunkPool:
+    """ Runs chunk jobs in parallel: on 'executor' if one is given, otherwise
+        on a ProcessPoolExecutor of 'workers' processes (default: the CPU
+        count) created on first use. A single chunk, or a single worker, runs
+        in the calling thread. Pass a ThreadPoolExecutor only with the NumPy
+        engine, which releases the GIL; other engines gain nothing from
+        threads. """
+
+    def __init__(self, executor=None, workers=None):
+        self._executor = executor
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def map(self, function, chunks, ivs):
+        executor = self._executor
+        if executor is None:
+            if len(chunks) < 2 or self.workers < 2:
+                return list(map(function, chunks, ivs))
+            with self._lock:
+                if self._pool is None:
+                    # Imported here: multiprocessing is slow to import and only
+                    # needed once a pool is actually created
+                    from concurrent.futures import ProcessPoolExecutor
+                    self._pool = ProcessPoolExecutor(self.workers)
+                executor = self._pool
+        return list(executor.map(function, chunks, ivs))
+
+    def close(self):
+        """ Shuts down the worker processes created by this pool, if any. """
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+def _open(file, mode):
+    """ Returns (file object, True if it was opened here). """
+    if hasattr(file, 'read' if mode == 'rb' else 'write'):
+        return file, False
+    return open(file, mode), True
+
+
+class ContainerWriter:
+    """ Writes a container chunk by chunk. Chunks are encrypted in batches
+        on worker processes, so the memory used is about 'batch_chunks'
+        chunks. Use it as a context manager or call close(), which writes
+        the index and footer and stops the workers. A with block that
+        raises writes no index, and a container it opened by path is
+        removed, so a truncated payload never looks complete.
+    """
+
+    def __init__(self, file, keyed, mode="CTR", chunk_size=DEFAULT_CHUNK_SIZE, batch_chunks=8,
+                 executor=None, workers=None):
+        """ Parameters:
+              file       - path or binary file object opened for writing
+              keyed      - KeyedContext of the key, e.g. tdes_keyed(key) or
+                           cipher.keyed()
+              mode       - "CTR" or "CBC"
+              chunk_size - plaintext bytes per chunk, a multiple of 8
+              batch_chunks - chunks encrypted together on the workers
+              executor - optional concurrent.futures executor to run the
+                         chunks on instead of a process pool
+              workers  - number of processes, defaults to the CPU count """
+        if mode not in MODES:
+            raise ValueError("Invalid container mode: " + mode)
+        if chunk_size <= 0 or chunk_size % 8 != 0:
+            raise ValueError("Chunk size must be a positive multiple of 8")
+        self.keyed = keyed
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.batch_chunks = max(1, batch_chunks)
+        self._pool = _ChunkPool(executor, workers)
+        self._encrypt = partial(_crypt_chunk, keyed._schedule, keyed.engine, mode, False)
+        self._file, self._owned = _open(file, 'wb')
+        self._buffer = bytearray()
+        self._pending = []
+        self._index = []
+        self._length = 0
+        self._closed = False
+        self._nonce = int.from_bytes(os.urandom(8), byteorder='big')
+        self._file.write(_HEADER.pack(MAGIC, CONTAINER_VERSION, keyed.nstages, MODES[mode], chunk_size))
+        self._offset = _HEADER.size
+
+    def write(self, data):
+        """ Adds data to the payload. Returns the number of bytes taken. """
+        if self._closed:
+            raise ValueError("Container already closed")
+        data = self.keyed._as_buffer(data)
+        self._buffer += data
+        self._length += len(data)
+        size = self.chunk_size
+        while len(self._buffer) >= size:
+            self._pending.append(bytes(self._buffer[:size]))
+            del self._buffer[:size]
+            if len(self._pending) >= self.batch_chunks:
+                self._flush()
+        return len(data)
+
+    def _flush(self):
+        """ Encrypts the pending chunks in parallel and appends them. """
+        if not self._pending:
+            return
+        ivs = self._ivs(len(self._index), len(self._pending))
+        encrypted = self._pool.map(self._encrypt, self._pending, ivs)
+        for plain, iv, out in zip(self._pending, ivs, encrypted):
+            self._file.write(out)
+            self._index.append((self._offset, len(out), len(plain), iv))
+            self._offset += len(out)
+        self._pending = []
+
+    def _ivs(self, first, count):
+        """ Returns the IVs of chunks first to first + count - 1. In CTR mode
+            the IV is the chunk's first counter value. """
+        if self.mode != "CTR":
+            return [os.urandom(8) for _ in range(count)]
+        step = self.chunk_size // 8
+        return [((self._nonce + (first + i) * step) & 0xFFFFFFFFFFFFFFFF).to_bytes(8, byteorder='big')
+                for i in range(count)]
+
+    def close(self):
+        """ Encrypts the last partial chunk and writes the index and footer. """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._buffer:
+                self._pending.append(bytes(self._buffer))
+                self._buffer = bytearray()
+            self._flush()
+            index = b''.join(_ENTRY.pack(*entry) for entry in self._index)
+            self._file.write(index)
+            self._file.write(_FOOTER.pack(self._offset, len(self._index), self._length, zlib.crc32(index), MAGIC))
+            self._file.flush()
+        finally:
+            self._pool.close()
+            if self._owned:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def abort(self):
+        """ Stops writing without an index or footer, so readers reject the
+            file, and removes the file if it was opened by path. """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._pool.close()
+        finally:
+            if self._owned:
+                self._file.close()
+                try:
+                    os.remove(self._file.name)
+                except OSError:
+                    pass
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class ContainerReader:
+    """ Random access to the plaintext of a container. Only the index is read
+        when it is opened; read(offset, length) decrypts the chunks that
+        overlap the requested range and nothing else, on worker processes
+        when there are several. A reader can be shared between threads;
+        close() stops its workers.
+    """
+
+    def __init__(self, file, keyed, executor=None, workers=None):
+        """ Parameters:
+              file     - path or seekable binary file object
+              keyed    - KeyedContext of the key the container was written with
+              executor - optional concurrent.futures executor used when a read
+                         spans several chunks, instead of a process pool
+              workers  - number of processes, defaults to the CPU count """
+        self.keyed = keyed
+        self._pool = _ChunkPool(executor, workers)
+        self._lock = threading.Lock()
+        self._file, self._owned = _open(file, 'rb')
+        try:
+            self._read_index()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_index(self):
+        f = self._file
+        header = self._read_at(0, _HEADER.size)
+        if len(header) != _HEADER.size:
+            raise ValueError("Truncated container")
+        magic, version, stages, mode, chunk_size = _HEADER.unpack(header)
+        if magic != MAGIC or version != CONTAINER_VERSION:
+            raise ValueError("Not a container of a supported version")
+        if stages != self.keyed.nstages:
+            raise ValueError("Container was written with %s" % ("DES" if stages == 1 else "Triple-DES"))
+        modes = {code: name for name, code in MODES.items()}
+        if mode not in modes or chunk_size == 0:
+            raise ValueError("Corrupt container header")
+        self.mode = modes[mode]
+        self.chunk_size = chunk_size
+        self._decrypt = partial(_crypt_chunk, self.keyed._schedule, self.keyed.engine, self.mode, True)
+        with self._lock:
+            end = f.seek(0, os.SEEK_END)
+        if end < _HEADER.size + _FOOTER.size:
+            raise ValueError("Truncated container")
+        index_offset, count, length, crc, magic = _FOOTER.unpack(self._read_at(end - _FOOTER.size, _FOOTER.size))
+        index = self._read_at(index_offset, count * _ENTRY.size)
+        if magic != MAGIC or len(index) != count * _ENTRY.size or zlib.crc32(index) != crc:
+            raise ValueError("Corrupt container index")
+        self.length = length
+        self._index = [_ENTRY.unpack_from(index, i * _ENTRY.size) for i in range(count)]
+
+    def _read_at(self, offset, size):
+        # Seeking and reading must not interleave between threads
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size)
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def chunks(self):
+        """ Number of chunks in the container. """
+        return len(self._index)
+
+    def read_chunk(self, i):
+        """ Decrypts and returns the plaintext of chunk 'i'. """
+        offset, stored, plain, iv = self._index[i]
+        out = self._decrypt(self._read_at(offset, stored), iv)
+        if len(out) != plain:
+            raise ValueError("Corrupt container chunk %d" % i)
+        return out
+
+    def read(self, offset=0, length=None):
+        """ Returns 'length' bytes of plaintext starting at 'offset' (up to the
+            end if 'length' is None), decrypting only the chunks involved. """
+        if offset < 0 or (length is not None and length < 0):
+            raise ValueError("Offset and length must not be negative")
+        end = self.length if length is None else min(self.length, offset + length)
+        if offset >= end:
+            return b''
+        first, last = offset // self.chunk_size, (end - 1) // self.chunk_size
+        if first == last:
+            data = self.read_chunk(first)
+        else:
+            entries = self._index[first:last + 1]
+            stored = [self._read_at(entry[0], entry[1]) for entry in entries]
+            plains = self._pool.map(self._decrypt, stored, [entry[3] for entry in entries])
+            for i, (entry, out) in enumerate(zip(entries, plains)):
+                if len(out) != entry[2]:
+                    raise ValueError("Corrupt container chunk %d" % (first + i))
+            data = b''.join(plains)
+        start = offset - first * self.chunk_size
+        return data[start:start + end - offset]
+
+    def close(self):
+        self._pool.close()
+        if self._owned:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_container(file, keyed, data, mode="CTR", chunk_size=DEFAULT_CHUNK_SIZE, executor=None, workers=None):
+    """ Writes 'data' as a container in one call. Returns the payload length. """
+    with ContainerWriter(file, keyed, mode, chunk_size, executor=executor, workers=workers) as writer:
+        return writer.write(data)
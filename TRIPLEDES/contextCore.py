@@ -0,0 +1,221 @@
+import sys
+
+from intCore import _IntCore
+from streamCore import StreamEncryptor, StreamDecryptor
+
+MODES = ("ECB", "CBC", "OFB", "CTR")
+
+
+class _ImmutableContext(_IntCore):
+    """ Base of the contexts: attributes are set once in __init__ and can
+        never change, so one context can be shared by any number of threads.
+        Everything that changes during an operation lives in the stream
+        objects that encryptor() and decryptor() return. """
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is immutable" % type(self).__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError("%s is immutable" % type(self).__name__)
+
+    def _set(self, **values):
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def _check_mode(self, mode, iv):
+        """ Validates a mode and its IV and returns the IV as bytes. """
+        if mode not in MODES:
+            raise ValueError("Invalid mode: " + mode)
+        if mode == "ECB":
+            return None
+        self._check_iv(iv)
+        return bytes(iv)
+
+
+class KeyedContext(_ImmutableContext):
+    """ Immutable key schedule and engine, shared across threads. The mode
+        and IV are given per call, so one keyed context serves every request
+        under its key:
+
+            keyed = tdes_keyed(key)
+            ct = keyed.encrypt(data, "CBC", iv)          # from any thread
+            cts = keyed.encrypt_all(messages, "CTR", ivs, max_workers=8)
+
+        With the NumPy engine, which releases the GIL on large batches,
+        threads encrypting big messages run in parallel. """
+    __slots__ = ('engine', '_schedule')
+
+    def __init__(self, schedule, engine=None):
+        """ Parameters:
+              schedule - precomputed key schedule
+              engine   - None for automatic selection or an engine name """
+        self._check_engine(engine)
+        self._set(engine=engine, _schedule=schedule)
+
+    @property
+    def nstages(self):
+        """ Number of DES passes of the key: 1 for DES, 3 for Triple-DES. """
+        return self._schedule.nstages
+
+    def encrypt(self, data, mode="ECB", iv=None):
+        """ Encrypts data in 'mode', padded like DES.encrypt(). 'iv' is
+            required for CBC, OFB and CTR modes. """
+        iv = self._check_mode(mode, iv)
+        return self._encrypt_mode(mode, data, self._schedule, iv, self.engine)
+
+    def decrypt(self, data, mode="ECB", iv=None):
+        """ Decrypts data in 'mode', like DES.decrypt(). """
+        iv = self._check_mode(mode, iv)
+        return self._decrypt_mode(mode, data, self._schedule, iv, self.engine)
+
+    def encryptor(self, mode="ECB", iv=None):
+        """ Returns a new StreamEncryptor, the state of one operation. """
+        iv = self._check_mode(mode, iv)
+        return StreamEncryptor(self, mode, self._schedule, iv, self.engine)
+
+    def decryptor(self, mode="ECB", iv=None):
+        """ Returns a new StreamDecryptor, the state of one operation. """
+        iv = self._check_mode(mode, iv)
+        return StreamDecryptor(self, mode, self._schedule, iv, self.engine)
+
+    def context(self, mode="ECB", iv=None):
+        """ Returns a CipherContext binding this key to a mode and IV. """
+        return CipherContext(self._schedule, mode, iv, self.engine)
+
+    def encrypt_all(self, messages, mode="ECB", ivs=None, executor=None, max_workers=None):
+        """ Encrypts every message, with ivs[i] for messages[i], on a
+            thread pool and returns the ciphertexts in order. See
+            map_threaded() for 'executor' and 'max_workers'. """
+        return map_threaded(lambda data, iv: self.encrypt(data, mode, iv), messages, ivs, executor, max_workers)
+
+    def decrypt_all(self, messages, mode="ECB", ivs=None, executor=None, max_workers=None):
+        """ Decrypts every message on a thread pool, the inverse of
+            encrypt_all(). """
+        return map_threaded(lambda data, iv: self.decrypt(data, mode, iv), messages, ivs, executor, max_workers)
+
+    def sizeof(self):
+        """ Returns the bytes held by this context and its schedule. """
+        return sys.getsizeof(self) + self._schedule.sizeof()
+
+
+class CipherContext(_ImmutableContext):
+    """ Compact per-session cipher: a key schedule, a mode and an IV in a
+        __slots__ object with no __dict__. The schedule is one array of 48-bit
+        subkeys shared through the schedule cache, used backwards to decrypt,
+        and the tables are shared by every object, so a Triple-DES context
+        takes about 600 bytes in both directions. Create one with
+        des_context() or tdes_context(), or from a cipher object with
+        cipher.context(). Like KeyedContext it is immutable and can be
+        shared between threads.
+    """
+    __slots__ = ('mode', 'iv', 'engine', '_schedule')
+
+    def __init__(self, schedule, mode="ECB", iv=None, engine=None):
+        """ Parameters:
+              schedule - precomputed key schedule
+              mode     - "ECB" or "CBC" or "OFB" or "CTR"
+              iv       - 64-bit byte string, required for CBC, OFB and CTR
+                         modes; in CTR mode it is the initial counter block
+              engine   - None for automatic selection or an engine name """
+        iv = self._check_mode(mode, iv)
+        self._check_engine(engine)
+        self._set(mode=mode, iv=iv, engine=engine, _schedule=schedule)
+
+    def encrypt(self, data):
+        """ Encrypts data, padded like DES.encrypt() and TDES.encrypt(). """
+        return self._encrypt_mode(self.mode, data, self._schedule, self.iv, self.engine)
+
+    def decrypt(self, data):
+        """ Decrypts data, like DES.decrypt() and TDES.decrypt(). """
+        return self._decrypt_mode(self.mode, data, self._schedule, self.iv, self.engine)
+
+    def encryptor(self):
+        """ Returns a StreamEncryptor starting from the context's IV. """
+        return StreamEncryptor(self, self.mode, self._schedule, self.iv, self.engine)
+
+    def decryptor(self):
+        """ Returns a StreamDecryptor starting from the context's IV. """
+        return StreamDecryptor(self, self.mode, self._schedule, self.iv, self.engine)
+
+    def sizeof(self):
+        """ Returns the bytes held by this context: the object, its schedule
+            and its IV. The mode and engine strings are shared constants. """
+        size = sys.getsizeof(self) + self._schedule.sizeof()
+        if self.iv is not None:
+            size += sys.getsizeof(self.iv)
+        return size
+
+
+def map_threaded(function, messages, ivs=None, executor=None, max_workers=None):
+    """ Calls function(messages[i], ivs[i]) for every message on a thread
+        pool and returns the results in order. 'executor' is any
+        concurrent.futures executor to reuse; otherwise a ThreadPoolExecutor
+        with 'max_workers' threads is created for the call. 'ivs' defaults to
+        None for every message. """
+    if ivs is None:
+        ivs = [None] * len(messages)
+    elif len(ivs) != len(messages):
+        raise ValueError("There must be one IV per message")
+    if executor is not None:
+        return list(executor.map(function, messages, ivs))
+    # Imported here so that importing cui_des stays fast
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers) as pool:
+        return list(pool.map(function, messages, ivs))
+
+
+_core = _IntCore()
+
+
+def _tdes_keys(key):
+    key = _core._as_buffer(key)
+    return [key[:8], key[8:16], key[:8] if len(key) == 16 else key[16:24]]
+
+
+def des_context(key, mode="ECB", iv=None, engine=None):
+    """ Returns a CipherContext for DES with an 8-byte key. """
+    if key is None:
+        raise ValueError("Key is None")
+    return CipherContext(_core._int_key_schedule(key), mode, iv, engine)
+
+
+def tdes_context(key, mode="ECB", iv=None, engine=None):
+    """ Returns a CipherContext for Triple-DES with a 24-byte key, or a
+        16-byte two-key Triple-DES key. """
+    if key is None:
+        raise ValueError("Key is None")
+    return CipherContext(_core._int_triple_key_schedule(_tdes_keys(key)), mode, iv, engine)
+
+
+def des_keyed(key, engine=None):
+    """ Returns a KeyedContext for DES with an 8-byte key. """
+    if key is None:
+        raise ValueError("Key is None")
+    return KeyedContext(_core._int_key_schedule(key), engine)
+
+
+def tdes_keyed(key, engine=None):
+    """ Returns a KeyedContext for Triple-DES with a 24-byte key, or a
+        16-byte two-key Triple-DES key. """
+    if key is None:
+        raise ValueError("Key is None")
+    return KeyedContext(_core._int_triple_key_schedule(_tdes_keys(key)), engine)
+
+
+def sizeof_session(cipher):
+    """ Returns the bytes held by one session object, a DES or TDES object or
+        a CipherContext, counting its attribute dictionary, key, IV and key
+        schedule but not the shared tables or interned strings. A keyed
+        context counts its schedule. """
+    if isinstance(cipher, _ImmutableContext):
+        return cipher.sizeof()
+    size = sys.getsizeof(cipher) + sys.getsizeof(cipher.__dict__)
+    for name, value in cipher.__dict__.items():
+        if name == '_schedule':
+            size += value.sizeof()
+        elif isinstance(value, (bytes, bytearray)):
+            size += sys.getsizeof(value)
+        elif isinstance(value, list):
+            size += sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return size
@@ -1,4 +1,7 @@
 class _Core:
+    # No per-instance state, so subclasses can be compact __slots__ classes
+    __slots__ = ()
+
     def __init__(self):
         pass
 
@@ -104,11 +107,9 @@ class _Core:
             bytes being added to the byte string.
         """
         # Determine the number of bytes to add
-        num_bytes_to_add = 8 - (len(message) % 8)
-        # Add the bytes to the message
-        message += bytes([num_bytes_to_add]) * num_bytes_to_add
-        # Return the message with the padding
-        return message
+        num_bytes_to_add = 8 - (memoryview(message).nbytes % 8)
+        # Add the bytes to a copy of the message, which may be any buffer
+        return b''.join((message, bytes([num_bytes_to_add]) * num_bytes_to_add))
 
 
     def _rem_padding(self, message):
@@ -211,10 +212,15 @@ class _Core:
         return new_block
 
     def _isInstance(self, key, bytes):
-        if type(key) == bytes:
-            return True
-        else:
+        """
+            Checks that 'key' is a byte string or any other object supporting
+            the buffer protocol (bytearray, memoryview, mmap, NumPy arrays).
+        """
+        try:
+            memoryview(key)
+        except TypeError:
             return False
+        return True
 
     def _encrypt_block(self, block, subkeys):
         """ Encrypts a single 64-bit block with the DES algorithm. The input is a
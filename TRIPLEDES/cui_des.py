@@ -1,110 +1,421 @@
+import sys
+
 from desCore import _DES
 from tDesCore import _TripleDES
+from intCore import _IntCore
+from streamCore import StreamEncryptor, StreamDecryptor, crypt_into
+import fileCrypt
+from parallelCore import ParallelPool, DEFAULT_SHARD_SIZE
+from ofbPipeline import KeystreamCache, OFBPipeline
+from instrument import instrumented
+from batchCore import crypt_many
+from contextCore import (CipherContext, KeyedContext, des_context, tdes_context, des_keyed, tdes_keyed,
+                         map_threaded, sizeof_session)
+from chunkContainer import ContainerReader, ContainerWriter, write_container
+from asyncStream import crypt_chunks, crypt_stream, DEFAULT_CHUNK_SIZE as ASYNC_CHUNK_SIZE
+
+
+def schedule_cache_info():
+    """ Returns the hits, misses, current size and maximum size of the shared
+        key schedule cache as a dictionary. """
+    return _IntCore._schedule_cache.info()
+
+
+def set_schedule_cache_size(maxsize):
+    """ Sets how many key schedules are kept in the shared cache. A size of
+        zero disables caching. """
+    _IntCore._schedule_cache.resize(maxsize)
+
+
+def clear_schedule_cache():
+    """ Empties the shared key schedule cache and resets its counters. """
+    _IntCore._schedule_cache.clear()
+
+
+def cbc_mac(key, data, padding=1, size=8):
+    """ Returns the CBC-MAC (ISO/IEC 9797-1 MAC algorithm 1) of data under
+        an 8-byte DES key or a 16/24-byte Triple-DES key. 'padding' is the
+        ISO 9797-1 padding method, 1 or 2, and 'size' the tag length. Method
+        1 is the standard default but gives messages that differ only in
+        trailing zero bytes the same MAC; use method 2 for messages whose
+        length varies. """
+    return _IntCore()._mac(data, key, "cbc", padding, size)
+
+
+def retail_mac(key, data, padding=1, size=8):
+    """ Returns the Retail MAC (ISO/IEC 9797-1 MAC algorithm 3, ANSI X9.19)
+        of data under the 16-byte key K || K'. Padding as for cbc_mac(). """
+    return _IntCore()._mac(data, key, "retail", padding, size)
+
+
+def engine_info():
+    """ Returns the capabilities, availability and fitted cost model of every
+        registered engine as a dictionary keyed by engine name. """
+    return _IntCore._registry.info()
+
+
+def calibrate_engines():
+    """ Times the engines on this machine, fits the cost models the automatic
+        selection uses and saves them next to the table file, where later
+        processes load them. Without it the selection uses built-in
+        estimates and never picks NumPy on its own. """
+    _IntCore._registry.calibrate(_IntCore())
+
+
+class _CipherMixin:
+    """ Methods shared by DES and TDES on top of their key schedule, mode, IV
+        and engine. '_nkeys' is the number of DES keys of the cipher. """
+    _nkeys = 1
+
+    def decrypt_range(self, data, start, end=None):
+        """ Returns bytes start to end (exclusive, default the end) of the
+            plaintext of 'data', decrypting only the blocks that cover them,
+            so one record can be read out of a large ciphertext. Offsets are
+            into the message that was encrypted, without padding, in every
+            mode. OFB has to run the cipher over the blocks before 'start',
+            but skips the XOR and keeps no keystream for them. """
+        if self.mode != "ECB":
+            self._check_iv(self.IV)
+        return self._decrypt_range(self.mode, data, self._schedule, self.IV, start, end, self.engine)
+
+    def _cached_ofb(self, data):
+        """ XORs data with OFB keystream taken from the keystream cache. """
+        data = self._as_buffer(data)
+        keystream = self.keystream_cache.keystream(self, self._cache_key, self._schedule.encrypt,
+                                                   bytes(self.IV), len(data))
+        return self._xor_bytes(data, keystream)
+
+    def ofb_pipeline(self, chunk_blocks=1024, depth=4):
+        """ Returns an OFBPipeline whose background thread generates the OFB
+            keystream for the current IV ahead of time, so update(chunk) only
+            XORs. It reads from and fills the keystream cache, if any, so
+            with a cache it must only be used to decrypt. """
+        if self.mode != "OFB":
+            raise ValueError("ofb_pipeline() requires OFB mode")
+        self._check_iv(self.IV)
+        return OFBPipeline(self, self._schedule.encrypt, self.IV, chunk_blocks, depth,
+                           self.keystream_cache, self._cache_key)
+
+    def encryptor(self):
+        """ Returns a StreamEncryptor that encrypts a message incrementally
+            with update(chunk) and finalize(), starting from the current IV. """
+        if self.mode != "ECB":
+            self._check_iv(self.IV)
+        return StreamEncryptor(self, self.mode, self._schedule, self.IV, self.engine)
+
+    def decryptor(self, strict=False):
+        """ Returns a StreamDecryptor that decrypts a message incrementally
+            with update(chunk) and finalize(), starting from the current IV.
+            A strict decryptor also removes the padding in OFB mode and
+            rejects invalid padding. """
+        if self.mode != "ECB":
+            self._check_iv(self.IV)
+        return StreamDecryptor(self, self.mode, self._schedule, self.IV, self.engine, strict)
+
+    def encrypt_into(self, src, dst):
+        """ Encrypts 'src' into the writable buffer 'dst' without allocating a
+            ciphertext of the full size, and returns the number of bytes
+            written. Both may be any buffer-protocol object. 'dst' needs room
+            for the padded ciphertext; to encrypt in place pass the same
+            buffer (CTR mode) or a view of its beginning as 'src'. """
+        needed = self._padded_length(self.mode, len(self._as_buffer(src)))
+        if len(self._as_buffer(dst)) < needed:
+            raise ValueError("Destination buffer is too small")
+        return crypt_into(self.encryptor(), src, dst)
+
+    def decrypt_into(self, src, dst):
+        """ Decrypts 'src' into the writable buffer 'dst' without allocating a
+            plaintext of the full size, and returns the number of bytes
+            written. 'dst' may be the same buffer as 'src' to decrypt in
+            place. It needs room for the plaintext without its padding,
+            which in ECB and CBC mode is found by decrypting the last block
+            before anything is written. """
+        context = self.decryptor()
+        src = self._as_buffer(src)
+        needed = len(src)
+        if self.mode in ("ECB", "CBC") and needed >= 8 and needed % 8 == 0:
+            last = self._decrypt_range(self.mode, src, self._schedule, self.IV, needed - 8, None, self.engine)
+            needed -= 8 - len(last)
+        if len(self._as_buffer(dst)) < needed:
+            raise ValueError("Destination buffer is too small")
+        return crypt_into(context, src, dst)
+
+    async def encrypt_stream(self, reader, writer, chunk_size=ASYNC_CHUNK_SIZE, executor=None):
+        """ Encrypts everything read from an asyncio StreamReader into a
+            StreamWriter, 'chunk_size' bytes at a time. The cipher runs on
+            'executor' (the loop's default if None) and writer.drain() is
+            awaited after each chunk. Returns (bytes read, bytes written). """
+        return await crypt_stream(self.encryptor(), reader, writer, chunk_size, executor)
+
+    async def decrypt_stream(self, reader, writer, chunk_size=ASYNC_CHUNK_SIZE, executor=None):
+        """ Decrypts everything read from an asyncio StreamReader into a
+            StreamWriter, like encrypt_stream(). """
+        return await crypt_stream(self.decryptor(), reader, writer, chunk_size, executor)
 
-class DES(_DES):
-    """ Implements the original DES algorithm with a 64-bit key and three block
-        modes: ECB, CBC, and OFB. """
+    def encrypt_chunks(self, reader, chunk_size=ASYNC_CHUNK_SIZE, executor=None):
+        """ Returns an async iterator over the ciphertext of everything read
+            from an asyncio StreamReader:
+                async for chunk in cipher.encrypt_chunks(reader): ... """
+        return crypt_chunks(self.encryptor(), reader, chunk_size, executor)
 
-    def __init__(self, key, mode="ECB", iv=None):
+    def decrypt_chunks(self, reader, chunk_size=ASYNC_CHUNK_SIZE, executor=None):
+        """ Returns an async iterator over the plaintext of everything read
+            from an asyncio StreamReader. """
+        return crypt_chunks(self.decryptor(), reader, chunk_size, executor)
+
+    @classmethod
+    def encrypt_many(cls, keys, messages, mode="ECB", ivs=None):
+        """ Encrypts messages[i] under keys[i] for a whole batch at once and
+            returns the list of ciphertexts. Keys are 8 bytes for DES and 24
+            bytes, or 16 bytes for two-key Triple-DES, for TDES. Key schedules
+            and rounds run across the batch bitsliced, with a different key
+            per lane, instead of one object and schedule per message.
+            Parameters:
+              mode - "ECB" or "CBC" (each message padded) or "CTR"; CBC
+                     chains of all messages advance in lockstep, block i of
+                     every message in one batch
+              ivs  - one IV per message in CBC mode, or one initial counter
+                     block per message in CTR mode """
+        return crypt_many(keys, messages, mode, ivs, cls._nkeys)
+
+    @classmethod
+    def decrypt_many(cls, keys, messages, mode="ECB", ivs=None):
+        """ Decrypts messages[i] under keys[i] for a whole batch at once, the
+            inverse of encrypt_many(). """
+        return crypt_many(keys, messages, mode, ivs, cls._nkeys, decrypt=True)
+
+    def encrypt_and_mac(self, data, mac_key, algorithm="retail", padding=2, size=8):
+        """ Encrypts data and computes the MAC of the plaintext under
+            'mac_key', which must be independent of the encryption key. In
+            CBC mode both chains run in one pass over the plaintext.
+            Parameters:
+              mac_key   - 16-byte K || K' for "retail" (ISO 9797-1 algorithm
+                          3), or a DES/TDES key for "cbc" (algorithm 1)
+              padding   - ISO 9797-1 padding method of the MAC, 2 or 1.
+                          Method 1 gives messages that differ only in
+                          trailing zero bytes the same tag, so use it only
+                          for messages of a fixed length
+              size      - length of the tag in bytes, at most 8
+            Returns a tuple (ciphertext, tag). """
+        if self.mode == "CBC":
+            self._check_iv(self.IV)
+            return self._cbc_encrypt_mac(data, self._schedule.encrypt, self.IV, mac_key, algorithm, padding, size,
+                                         self.engine)
+        return self.encrypt(data), self._mac(data, mac_key, algorithm, padding, size)
+
+    def decrypt_and_verify(self, data, tag, mac_key, algorithm="retail", padding=2, size=8):
+        """ Decrypts data and checks 'tag' against the MAC of the plaintext,
+            as made by encrypt_and_mac() with the same algorithm, padding and
+            size. The tag length is fixed by 'size', never by the tag, so a
+            shorter tag fails like a wrong one. Returns the plaintext or
+            raises ValueError if the tag does not match. """
+        # Imported here so that importing cui_des stays fast
+        import hmac
+        plain = self.decrypt(data)
+        if self.mode == "OFB":
+            # OFB decryption keeps the padding; the MAC covers the message
+            plain = self._rem_padding(plain)
+        expected = self._mac(plain, mac_key, algorithm, padding, size)
+        tag = bytes(self._as_buffer(tag))
+        if len(tag) != size or not hmac.compare_digest(expected, tag):
+            raise ValueError("MAC check failed")
+        return plain
+
+    def context(self):
+        """ Returns a compact CipherContext sharing this object's key
+            schedule, with its mode, current IV and engine. Prefer it to
+            whole cipher objects when many sessions are kept alive. """
+        return CipherContext(self._schedule, self.mode, self.IV, self.engine)
+
+    def keyed(self):
+        """ Returns an immutable KeyedContext sharing this object's key
+            schedule and engine. Unlike this object it has no IV to reset, so
+            one keyed context can serve concurrent threads, each passing its
+            own mode and IV per call. """
+        return KeyedContext(self._schedule, self.engine)
+
+    def parallel(self, workers=None, shard_size=DEFAULT_SHARD_SIZE):
+        """ Returns a ParallelPool that spreads ECB and CTR in both directions
+            and CBC decryption of large inputs over 'workers' processes. Use it as a
+            context manager or call close() when done. """
+        return ParallelPool(self, workers, shard_size)
+
+
+class DES(_CipherMixin, _DES):
+    """ Implements the original DES algorithm with a 64-bit key and four block
+        modes: ECB, CBC, OFB, and CTR. """
+
+    def __init__(self, key, mode="ECB", iv=None, engine=None, keystream_cache=None):
         """ Creates a new encryption object
             Parameters:
               key  - 64-bit secret key given as a byte string
-              mode - "ECB" or "CBC" or "OFB"
-              iv   - 64-bit byte string that is required for CBC and OFB modes """
+              mode - "ECB" or "CBC" or "OFB" or "CTR"
+              iv   - 64-bit byte string that is required for CBC, OFB and CTR
+                     modes; in CTR mode it is the initial counter block
+              engine - None to let the engine registry pick a backend per
+                       call from the mode and size, or "reference", "int",
+                       "bitslice" or "numpy" to force one
+              keystream_cache - optional KeystreamCache that OFB decryption
+                       reads keystream from instead of running the cipher.
+                       encrypt() never uses it, so two messages can never be
+                       encrypted with cached keystream. """
+        if key is None:
+            raise ValueError("Key is None")
+        self._check_engine(engine)
         self.key = key
         self.mode = mode
+        self.engine = engine
+        self.keystream_cache = keystream_cache
         self.originalIV = b'\x00' * 8
         if iv is None and mode != "ECB":
             self.IV = self.originalIV
         self.IV = iv
+        # The key schedule is computed once and reused by every call
+        self._schedule = self._int_key_schedule(key)
+        self._cache_key = key.to_bytes(8, byteorder='big') if type(key) == int else bytes(key[:8])
 
     def reset(self):
         """ Resets the IV to its original value to start a new encryption or
-            decryption. This function only applies to CBC and OFB modes """
+            decryption. This function only applies to CBC, OFB and CTR modes """
         self.IV = self.originalIV
 
     def encrypt(self, data):
         """ Encrypts data with the DES encryption algorithm
             Parameters:
               data (bytes) - raw byte string to be encrypted """
-        if self.mode == "ECB":
-            encrypted = self.encryptECB(data, self.key)
-        elif self.mode == "CBC":
-            encrypted = self.encryptCBC(data, self.key, self.IV)
-        elif self.mode == "OFB":
-            encrypted = self.encryptOFB(data, self.key, self.IV)
-        else:
-            raise ValueError("Invalid mode: " + self.mode)
-        return encrypted
+        if self.mode != "ECB":
+            self._check_iv(self.IV)
+        return self._encrypt_mode(self.mode, data, self._schedule, self.IV, self.engine)
 
     def decrypt(self, data):
         """ Decrypts data with the DES encryption algorithm.
             Parameters:
               data - raw byte string to be decrypted """
-        if self.mode == "ECB":
-            decrypted = self.decryptECB(data, self.key)
-        elif self.mode == "CBC":
-            decrypted = self.decryptCBC(data, self.key, self.IV)
-        elif self.mode == "OFB":
-            decrypted = self.decryptOFB(data, self.key, self.IV)
-        else:
-            raise ValueError("Invalid mode: " + self.mode)
-        return decrypted
+        if self.mode != "ECB":
+            self._check_iv(self.IV)
+        if self.mode == "OFB" and self.keystream_cache is not None:
+            return self._cached_ofb(data)
+        return self._decrypt_mode(self.mode, data, self._schedule, self.IV, self.engine)
 
 
-class TDES(_TripleDES):
-    """ Implements the Triple DES algorithm with a 192-bit key and three block
-        modes: ECB, CBC, and OFB. """
+class TDES(_CipherMixin, _TripleDES):
+    """ Implements the Triple DES algorithm with a 192-bit key and four block
+        modes: ECB, CBC, OFB, and CTR. """
+    _nkeys = 3
 
-    def __init__(self, key, mode="ECB", iv=None):
+    def __init__(self, key, mode="ECB", iv=None, engine=None, keystream_cache=None):
         """ Creates a new encryption object.
             Parameters:
-              key  - 64-bit secret key given as a byte string
-              mode - "ECB" or "CBC" or "OFB"
-              iv   - 64-bit byte string that is required for CBC and OFB modes """
+              key  - 192-bit secret key given as a byte string, or a 128-bit
+                     key for two-key Triple-DES
+              mode - "ECB" or "CBC" or "OFB" or "CTR"
+              iv   - 64-bit byte string that is required for CBC, OFB and CTR
+                     modes; in CTR mode it is the initial counter block
+              engine - None to let the engine registry pick a backend per
+                       call from the mode and size, or "reference", "int",
+                       "bitslice" or "numpy" to force one
+              keystream_cache - optional KeystreamCache that OFB decryption
+                       reads keystream from instead of running the cipher.
+                       encrypt() never uses it, so two messages can never be
+                       encrypted with cached keystream. """
+        self._check_engine(engine)
         self.key = key
         self.mode = mode
+        self.engine = engine
+        self.keystream_cache = keystream_cache
         self.originalIV = b'\x00' * 8
         if iv is None and mode != "ECB":
             self.IV = self.originalIV
         self.IV = iv
         self._split_encryption_keys()
+        # The key schedule is computed once and reused by every call
+        self._schedule = self._int_triple_key_schedule(self.key)
+        self._cache_key = b''.join(bytes(k) for k in self.key)
 
     def _split_encryption_keys(self):
         """ Splits a Triple-DES encryption key into three 8-byte subkeys. Each
-            subkey will be used for one of the DES rounds """
+            subkey will be used for one of the DES rounds. A 16-byte key is
+            two-key Triple-DES, where the third subkey is the first. """
         key = self.key
-        self.key = [key[:8], key[8:16], key[16:24]]
+        if len(self._as_buffer(key)) == 16:
+            self.key = [key[:8], key[8:16], key[:8]]
+        else:
+            self.key = [key[:8], key[8:16], key[16:24]]
     def reset(self):
         """ Resets the IV to its original value to start a new encryption or
-            decryption. This function only applies to CBC and OFB modes """
-        self.key = self.originalIV
-        self._split_encryption_keys()
+            decryption. This function only applies to CBC, OFB and CTR modes """
+        self.IV = self.originalIV
 
     def encrypt(self, data):
         """ Encrypts data with the Triple-DES encryption algorithm.
             Parameters:
               data - raw byte string to be encrypted """
-        if self.mode == "ECB":
-            encrypted = self.tEncryptECB(data, self.key)
-        elif self.mode == "CBC":
-            encrypted = self.tEncryptCBC(data, self.key, self.IV)
-        elif self.mode == "OFB":
-            encrypted = self.tEncryptOFB(data, self.key, self.IV)
-        else:
-            raise ValueError("Invalid mode: " + self.mode)
-        return encrypted
+        if self.mode != "ECB":
+            self._check_iv(self.IV)
+        return self._encrypt_mode(self.mode, data, self._schedule, self.IV, self.engine)
 
     def decrypt(self, data):
         """ Decrypts data with the Triple-DES encryption algorithm.
             Parameters:
               data - raw byte string to be decrypted """
-        if self.mode == "ECB":
-            decrypted = self.tDecryptECB(data, self.key)
-        elif self.mode == "CBC":
-            decrypted = self.tDecryptCBC(data, self.key, self.IV)
-        elif self.mode == "OFB":
-            decrypted = self.tDecryptOFB(data, self.key, self.IV)
+        if self.mode != "ECB":
+            self._check_iv(self.IV)
+        if self.mode == "OFB" and self.keystream_cache is not None:
+            return self._cached_ofb(data)
+        return self._decrypt_mode(self.mode, data, self._schedule, self.IV, self.engine)
+
+
+def main(argv=None):
+    """ Command line entry point:
+          python -m cui_des encrypt|decrypt --key HEX [--mode CBC] [--iv HEX]
+                            [--chunk-size N] [--engine NAME] infile outfile
+        An 8-byte key selects DES, and a 24-byte or 16-byte (two-key) key
+        Triple-DES. Files are processed through mmap in chunks and the
+        throughput is reported on stderr. Errors are reported as usage errors
+        and leave no output file behind. """
+    import argparse
+    import os
+    parser = argparse.ArgumentParser(prog="cui_des", description="Encrypt or decrypt files with DES or Triple-DES.")
+    parser.add_argument("action", choices=["encrypt", "decrypt"])
+    parser.add_argument("infile")
+    parser.add_argument("outfile")
+    parser.add_argument("--key", required=True, help="8-byte (DES) or 16/24-byte (TDES) key in hex")
+    parser.add_argument("--mode", default="ECB", choices=["ECB", "CBC", "OFB", "CTR"])
+    parser.add_argument("--iv", help="8-byte IV in hex, required for CBC, OFB and CTR")
+    parser.add_argument("--chunk-size", type=int, default=fileCrypt.DEFAULT_CHUNK_SIZE,
+                        help="bytes read per chunk, a multiple of 8 (default %(default)s)")
+    parser.add_argument("--engine", default=None, choices=_IntCore._registry.names(available_only=False),
+                        help="backend to force (default: chosen per chunk by size and mode)")
+    args = parser.parse_args(argv)
+
+    try:
+        key = bytes.fromhex(args.key)
+        iv = bytes.fromhex(args.iv) if args.iv else None
+    except ValueError:
+        parser.error("key and IV must be hexadecimal")
+    if len(key) not in (8, 16, 24):
+        parser.error("key must be 8 bytes (DES) or 16 or 24 bytes (TDES)")
+    if args.mode != "ECB" and iv is None:
+        parser.error("--iv is required in %s mode" % args.mode)
+    if os.path.exists(args.outfile) and os.path.exists(args.infile) and os.path.samefile(args.infile,
+                                                                                         args.outfile):
+        parser.error("infile and outfile must be different files")
+    try:
+        if len(key) == 8:
+            cipher = DES(key, args.mode, iv, engine=args.engine)
         else:
-            raise ValueError("Invalid mode: " + self.mode)
-        return decrypted
\ No newline at end of file
+            cipher = TDES(key, args.mode, iv, engine=args.engine)
+        if args.action == "encrypt":
+            read, written, seconds = fileCrypt.encrypt_file(cipher, args.infile, args.outfile, args.chunk_size)
+        else:
+            read, written, seconds = fileCrypt.decrypt_file(cipher, args.infile, args.outfile, args.chunk_size)
+    except (ValueError, ImportError, OSError) as e:
+        parser.error(str(e))
+    rate = read / seconds / 1e6 if seconds > 0 else float('inf')
+    print("%sed %d bytes -> %d bytes in %.3f s (%.2f MB/s)" % (args.action.capitalize(), read, written, seconds, rate),
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
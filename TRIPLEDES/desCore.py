@@ -1,57 +1,46 @@
-from core import _Core
-class _DES(_Core):
+from intCore import _IntCore
+class _DES(_IntCore):
 
     def encryptECB(self, data, key):
         """ Encrypts plaintext data with DES (Data Encryption Standard).
     
             Parameters:
-              data (bytes): input data to be encrypted
+              data (bytes-like): input data to be encrypted
               key (bytes):  64-bit key used for DES encryption
     
             Returns:
               An encrypted byte string of equal length to the original data
         """
-        if key == None:
+        if key is None:
             raise ValueError("Key is None")
         '''if len(key) != 8:
             raise ValueError("Key must be 8 bytes long")
         '''
         if not self._isInstance(key, bytes):
-            raise TypeError("Key must be a bytestring")
+            raise TypeError("Key must be a bytes-like object")
         pt = self._add_padding(data)  # add padding
-        pt = self._bytes_to_bit_array(pt)  # convert to bit array
-        ct = []
-        subkeys = self._generate_subkeys(key)  # generate subkeys
-        for block in self._nsplit(pt, 64):
-            ct += self._encrypt_block(block, subkeys)  # encrypt each block
-        ct = self._bit_array_to_bytes(ct)
-        return ct
+        schedule = self._int_key_schedule(key)  # generate subkeys
+        return self._ecb(pt, schedule.encrypt)  # encrypt each block
     
     def decryptECB(self, data, key):
         """ Decrypts ciphertext data with DES (Data Encryption Standard).
     
             Parameters:
-              data (bytes): input data to be decrypted
+              data (bytes-like): input data to be decrypted
               key (bytes):  64-bit key used for DES decryption
     
             Returns:
               A decrypted byte string of equal length to the original data
         """
-        if key == None:
+        if key is None:
             raise ValueError("Key is None")
         '''if len(key) != 8:
             raise ValueError("Key must be 8 bytes long")
         '''
         if not self._isInstance(key, bytes):
-            raise TypeError("Key must be a bytestring")
-        pt = data  # add padding
-        pt = self._bytes_to_bit_array(pt)  # convert to bit array
-        ct = []
-        subkeys = list(reversed(self._generate_subkeys(key)))  # generate subkeys
-        for block in self._nsplit(pt, 64):
-            ct += self._encrypt_block(block, subkeys)  # encrypt each block
-        #ct = _rem_padding(ct)
-        ct = self._bit_array_to_bytes(ct)
+            raise TypeError("Key must be a bytes-like object")
+        schedule = self._int_key_schedule(key)  # generate subkeys
+        ct = self._ecb(data, schedule.decrypt)  # decrypt each block
         ct = self._rem_padding(ct)
         return ct
     
@@ -59,78 +48,56 @@ class _DES(_Core):
         """ Encrypts plaintext data with DES (Data Encryption Standard).
     
             Parameters:
-              data (bytes): input data to be encrypted
+              data (bytes-like): input data to be encrypted
               key (bytes):  64-bit key used for DES encryption
               iv (bytes):   64-bit initialization vector
     
             Returns:
               An encrypted byte string of equal length to the original data
         """
-        if key == None:
+        if key is None:
             raise ValueError("Key is None")
         '''if len(key) != 8:
             raise ValueError("Key must be 8 bytes long")
         '''
         if not self._isInstance(key, bytes):
-            raise TypeError("Key must be a bytestring")
-        if iv == None:
+            raise TypeError("Key must be a bytes-like object")
+        if iv is None:
             raise ValueError("IV is None")
-        if len(iv) != 8:
+        if len(self._as_buffer(iv)) != 8:
             raise ValueError("IV must be 8 bytes long")
         if not self._isInstance(iv, bytes):
-            raise TypeError("IV must be a bytestring")
+            raise TypeError("IV must be a bytes-like object")
         pt = self._add_padding(data)  # add padding
-        pt = self._bytes_to_bit_array(pt)  # convert to bit array
-        ct = []
-        subkeys = self._generate_subkeys(key)  # generate subkeys
-        iv = self._bytes_to_bit_array(iv)  # convert IV to bit array
-        for block in self._nsplit(pt, 64):
-            # XOR the IV with the plaintext block
-            block = self._xor(block, iv)
-            # Encrypt the block
-            ct += self._encrypt_block(block, subkeys)
-            # Set the IV to the ciphertext block
-            iv = ct[-64:]
-        ct = self._bit_array_to_bytes(ct)
-        return ct
+        schedule = self._int_key_schedule(key)  # generate subkeys
+        return self._cbc_encrypt(pt, schedule.encrypt, iv)
     
     def decryptCBC(self, data, key, iv):
         """ Decrypts ciphertext data with DES (Data Encryption Standard).
     
             Parameters:
-              data (bytes): input data to be decrypted
+              data (bytes-like): input data to be decrypted
               key (bytes):  64-bit key used for DES decryption
               iv (bytes):   64-bit initialization vector
     
             Returns:
               A decrypted byte string of equal length to the original data
         """
-        if key == None:
+        if key is None:
             raise ValueError("Key is None")
         '''if len(key) != 8:
             raise ValueError("Key must be 8 bytes long")
         '''
         if not self._isInstance(key, bytes):
-            raise TypeError("Key must be a bytestring")
-        if iv == None:
+            raise TypeError("Key must be a bytes-like object")
+        if iv is None:
             raise ValueError("IV is None")
-        if len(iv) != 8:
+        if len(self._as_buffer(iv)) != 8:
             raise ValueError("IV must be 8 bytes long")
         if not self._isInstance(iv, bytes):
-            raise TypeError("IV must be a bytestring")
-        pt = data# add padding
-        pt = self._bytes_to_bit_array(pt)  # convert to bit array
-        ct = []
-        subkeys = list(reversed(self._generate_subkeys(key)))  # generate subkeys
-        iv = self._bytes_to_bit_array(iv)  # convert IV to bit array
-        for block in self._nsplit(pt, 64):
-            # Decrypt the block
-            ct += self._encrypt_block(block, subkeys)
-            # XOR the IV with the plaintext block
-            ct[-64:] = self._xor(ct[-64:], iv)
-            # Set the IV to the ciphertext block
-            iv = block
-        ct = self._bit_array_to_bytes(ct)
+            raise TypeError("IV must be a bytes-like object")
+        schedule = self._int_key_schedule(key)  # generate subkeys
+        ct = self._cbc_decrypt(data, schedule.decrypt, iv)
         ct = self._rem_padding(ct)
         return ct
     
@@ -138,77 +105,156 @@ class _DES(_Core):
         """ Encrypts plaintext data with DES (Data Encryption Standard).
     
             Parameters:
-              data (bytes): input data to be encrypted
+              data (bytes-like): input data to be encrypted
               key (bytes):  64-bit key used for DES encryption
               iv (bytes):   64-bit initialization vector
     
             Returns:
               An encrypted byte string of equal length to the original data
         """
-        if key == None:
+        if key is None:
             raise ValueError("Key is None")
         '''if len(key) != 8:
             raise ValueError("Key must be 8 bytes long")
         '''
         if not self._isInstance(key, bytes):
-            raise TypeError("Key must be a bytestring")
-        if iv == None:
+            raise TypeError("Key must be a bytes-like object")
+        if iv is None:
             raise ValueError("IV is None")
-        if len(iv) != 8:
+        if len(self._as_buffer(iv)) != 8:
             raise ValueError("IV must be 8 bytes long")
         if not self._isInstance(iv, bytes):
-            raise TypeError("IV must be a bytestring")
+            raise TypeError("IV must be a bytes-like object")
 
         pt = self._add_padding(data)  # add padding
-        pt = self._bytes_to_bit_array(pt)  # convert to bit array
-        ct = []
-        subkeys = self._generate_subkeys(key)  # generate subkeys
-        iv = self._bytes_to_bit_array(iv)  # convert IV to bit array
-        for block in self._nsplit(pt, 64):
-            # Encrypt the IV
-            iv = self._encrypt_block(iv, subkeys)
-            # XOR the IV with the plaintext block
-            ct += self._xor(block, iv)
-        ct = self._bit_array_to_bytes(ct)
-        return ct
+        schedule = self._int_key_schedule(key)  # generate subkeys
+        return self._ofb(pt, schedule.encrypt, iv)
     
     def decryptOFB(self, data, key, iv):
         """ Decrypts ciphertext data with DES (Data Encryption Standard).
     
             Parameters:
-              data (bytes): input data to be decrypted
+              data (bytes-like): input data to be decrypted
               key (bytes):  64-bit key used for DES decryption
               iv (bytes):   64-bit initialization vector
     
             Returns:
               A decrypted byte string of equal length to the original data
         """
-        if key == None:
+        if key is None:
             raise ValueError("Key is None")
         '''if len(key) != 8:
             raise ValueError("Key must be 8 bytes long")
         '''
         if not self._isInstance(key, bytes):
-            raise TypeError("Key must be a bytestring")
-        if iv == None:
+            raise TypeError("Key must be a bytes-like object")
+        if iv is None:
             raise ValueError("IV is None")
-        if len(iv) != 8:
+        if len(self._as_buffer(iv)) != 8:
             raise ValueError("IV must be 8 bytes long")
         if not self._isInstance(iv, bytes):
-            raise TypeError("IV must be a bytestring")
-        pt = data
-        pt = self._bytes_to_bit_array(pt)  # convert to bit array
-        ct = []
-        subkeys = self._generate_subkeys(key)  # generate subkeys
-        iv = self._bytes_to_bit_array(iv)  # convert IV to bit array
-        for block in self._nsplit(pt, 64):
-            # Encrypt the IV
-            iv = self._encrypt_block(iv, subkeys)
-            # XOR the IV with the ciphertext block
-            ct += self._xor(block, iv)
-        ct = self._bit_array_to_bytes(ct)
-
-        return ct
+            raise TypeError("IV must be a bytes-like object")
+        schedule = self._int_key_schedule(key)  # generate subkeys
+        return self._ofb(data, schedule.encrypt, iv)
+    
+    def encryptCTR(self, data, key, iv):
+        """ Encrypts plaintext data with DES (Data Encryption Standard) in
+            counter mode. Block i is XORed with the encryption of iv + i, so no
+            padding is added and any block can be processed independently.
+    
+            Parameters:
+              data (bytes-like): input data to be encrypted
+              key (bytes):  64-bit key used for DES encryption
+              iv (bytes):   64-bit initial counter block
+    
+            Returns:
+              An encrypted byte string of equal length to the original data
+        """
+        if key is None:
+            raise ValueError("Key is None")
+        if not self._isInstance(key, bytes):
+            raise TypeError("Key must be a bytes-like object")
+        self._check_iv(iv)
+        schedule = self._int_key_schedule(key)  # generate subkeys
+        return self._ctr(data, schedule.encrypt, iv)
+    
+    def decryptCTR(self, data, key, iv):
+        """ Decrypts ciphertext data with DES (Data Encryption Standard) in
+            counter mode.
+    
+            Parameters:
+              data (bytes-like): input data to be decrypted
+              key (bytes):  64-bit key used for DES decryption
+              iv (bytes):   64-bit initial counter block
+    
+            Returns:
+              A decrypted byte string of equal length to the original data
+        """
+        return self.encryptCTR(data, key, iv)
+    
+    def macCBC(self, data, key, padding=1, size=8):
+        """ Computes the DES CBC-MAC (ISO/IEC 9797-1 MAC algorithm 1) of data.
+    
+            Parameters:
+              data (bytes-like): message to authenticate
+              key (bytes):  64-bit MAC key
+              padding (int): ISO 9797-1 padding method, 1 or 2; method 1
+                             is only safe for fixed-length messages
+              size (int):   length of the tag in bytes, at most 8
+    
+            Returns:
+              The leftmost 'size' bytes of the last CBC block
+        """
+        if key is None:
+            raise ValueError("Key is None")
+        if not self._isInstance(key, bytes):
+            raise TypeError("Key must be a bytes-like object")
+        return self._mac(data, key, "cbc", padding, size)
+    
+    def macRetail(self, data, key, padding=1, size=8):
+        """ Computes the Retail MAC (ISO/IEC 9797-1 MAC algorithm 3, ANSI
+            X9.19) of data: a DES CBC-MAC under K whose last block is
+            decrypted with K' and encrypted again with K.
+    
+            Parameters:
+              data (bytes-like): message to authenticate
+              key (bytes):  128-bit MAC key K || K'
+              padding (int): ISO 9797-1 padding method, 1 or 2; method 1
+                             is only safe for fixed-length messages
+              size (int):   length of the tag in bytes, at most 8
+    
+            Returns:
+              The MAC of the data
+        """
+        if key is None:
+            raise ValueError("Key is None")
+        if not self._isInstance(key, bytes):
+            raise TypeError("Key must be a bytes-like object")
+        return self._mac(data, key, "retail", padding, size)
+    
+    def encryptCBCAndMAC(self, data, key, iv, macKey, padding=2, size=8):
+        """ Encrypts data with DES in CBC mode and computes the Retail MAC of
+            the plaintext in the same pass over the data.
+    
+            Parameters:
+              data (bytes-like): input data to be encrypted
+              key (bytes):  64-bit key used for DES encryption
+              iv (bytes):   64-bit initialization vector
+              macKey (bytes): 128-bit Retail MAC key, not related to 'key'
+              padding (int): ISO 9797-1 padding method of the MAC, 2 or 1
+                             (method 1 only for fixed-length messages)
+              size (int):   length of the tag in bytes, at most 8
+    
+            Returns:
+              A tuple (ciphertext, tag)
+        """
+        if key is None:
+            raise ValueError("Key is None")
+        if not self._isInstance(key, bytes):
+            raise TypeError("Key must be a bytes-like object")
+        self._check_iv(iv)
+        schedule = self._int_key_schedule(key)  # generate subkeys
+        return self._cbc_encrypt_mac(data, schedule.encrypt, iv, macKey, "retail", padding, size)
     
     def _run_integration_tests(self, plaintext, key, mode='ECB', iv=None):
         """ Runs a set of integration tests to ensure that the DES implementation
@@ -234,6 +280,16 @@ class _DES(_Core):
             print('Testing DES decryption...')
             decrypted = self.decryptCBC(ciphertext, key, iv)
             print('Decrypted: %s' % decrypted)
+        if mode == "CTR":
+            print('Testing DES encryption...')
+            print('Plaintext: %s' % plaintext)
+            print('Key: %s' % key)
+            ciphertext = self.encryptCTR(plaintext, key, iv)
+            print('Ciphertext: %s' % ciphertext)
+            # DES decryption test
+            print('Testing DES decryption...')
+            decrypted = self.decryptCTR(ciphertext, key, iv)
+            print('Decrypted: %s' % decrypted)
         if mode == "OFB":
             print('Testing DES encryption...')
             print('Plaintext: %s' % plaintext)
@@ -0,0 +1,214 @@
+import importlib.util
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import tables
+
+ALL_MODES = ("ECB", "CBC", "OFB", "CTR")
+
+# Inputs below this many blocks always run on the scalar integer engine, so
+# short messages never pay for a batch engine's setup or for importing NumPy.
+SMALL_BLOCKS = 64
+
+COSTS_VERSION = 1
+
+
+class _Engine:
+    """ Description of one DES backend.
+          name     - name passed as engine= to DES and TDES
+          modes    - block modes the engine can take part in
+          batch    - True if the engine only processes independent blocks in
+                     bulk. Batch engines serve ECB, CTR and CBC decryption;
+                     CBC encryption and OFB then run on the integer engine.
+          requires - optional modules that must be importable
+          ecb      - name of the core method encrypting independent blocks
+          block    - name of the core method encrypting one integer block, or
+                     None for batch engines
+          auto     - whether the selector may pick the engine on its own
+          setup, per_block - built-in cost estimate in seconds, used until
+                     calibrate() measures this machine. An engine without
+                     one is only picked once it has been calibrated.
+    """
+
+    def __init__(self, name, modes, batch, ecb, block=None, requires=(), auto=True, setup=None, per_block=None):
+        self.name = name
+        self.modes = tuple(modes)
+        self.batch = batch
+        self.ecb = ecb
+        self.block = block
+        self.requires = tuple(requires)
+        self.auto = auto
+        # Cost model: seconds = setup + per_block * blocks
+        self.setup = setup
+        self.per_block = per_block
+
+    def available(self):
+        """ Returns True if every optional dependency can be imported. """
+        return all(importlib.util.find_spec(module) is not None for module in self.requires)
+
+    def info(self):
+        return {'modes': list(self.modes), 'batch': self.batch, 'requires': list(self.requires),
+                'available': self.available(), 'auto': self.auto,
+                'setup_s': self.setup, 'per_block_s': self.per_block}
+
+
+def costs_path():
+    """ Returns the file calibrate() saves the fitted costs to: engine_costs.json
+        in the directory of the table file (see tables.default_path()). """
+    return os.path.join(os.path.dirname(tables.default_path()), 'engine_costs.json')
+
+
+class _EngineRegistry:
+    """ Registered engines and the selector that picks one for a workload.
+        Every engine has a linear cost model and the selector picks the one
+        with the lowest predicted time. The models start from built-in
+        estimates; calibrate() measures them on this machine and saves them
+        next to the table file, and the first selection in every later
+        process loads that file. Nothing is timed on the request path.
+    """
+
+    SMALL_BLOCKS = SMALL_BLOCKS
+
+    def __init__(self):
+        self._engines = OrderedDict()
+        self._lock = threading.Lock()
+        self._costs_loaded = False
+
+    def register(self, engine):
+        """ Adds an engine, replacing one with the same name. """
+        with self._lock:
+            self._engines[engine.name] = engine
+
+    def get(self, name):
+        """ Returns the engine called 'name'. Raises ValueError for unknown
+            names and ImportError if its optional dependencies are missing. """
+        engine = self._engines.get(name)
+        if engine is None:
+            raise ValueError("Invalid engine: " + str(name))
+        if not engine.available():
+            raise ImportError("Engine '%s' requires %s" % (name, ', '.join(engine.requires)))
+        return engine
+
+    def names(self, available_only=True):
+        return [name for name, engine in self._engines.items() if engine.available() or not available_only]
+
+    def info(self):
+        """ Returns the capabilities and cost model of every engine. """
+        return {name: engine.info() for name, engine in self._engines.items()}
+
+    def _candidates(self, mode, chained):
+        engines = [e for e in self._engines.values() if e.auto and mode in e.modes and e.available()]
+        if chained:
+            engines = [e for e in engines if e.block is not None]
+        return engines
+
+    def select(self, core, mode, nblocks, chained=False):
+        """ Returns the engine to use for 'nblocks' blocks in 'mode'. 'chained'
+            is True for CBC encryption and OFB, where each block depends on the
+            previous one and only scalar engines apply. """
+        if nblocks < SMALL_BLOCKS or chained:
+            return self._engines['int']
+        if not self._costs_loaded:
+            self.load_costs()
+        best, best_cost = self._engines['int'], None
+        for engine in self._candidates(mode, chained):
+            if engine.per_block is None:
+                continue
+            cost = engine.setup + engine.per_block * nblocks
+            if best_cost is None or cost < best_cost:
+                best, best_cost = engine, cost
+        return best
+
+    def load_costs(self, path=None):
+        """ Reads the costs saved by calibrate() from 'path' (default
+            costs_path()) into the engines it names. Returns True if a valid
+            file was read; otherwise the current estimates are kept. Only the
+            first call does anything unless a path is given. """
+        with self._lock:
+            if self._costs_loaded and path is None:
+                return False
+            self._costs_loaded = True
+            try:
+                with open(path or costs_path()) as f:
+                    saved = json.load(f)
+                if saved.get('version') != COSTS_VERSION:
+                    return False
+                costs = {name: (float(cost['setup']), float(cost['per_block']))
+                         for name, cost in saved['engines'].items() if name in self._engines}
+            except (OSError, ValueError, TypeError, KeyError, AttributeError):
+                return False
+            for name, (setup, per_block) in costs.items():
+                self._engines[name].setup, self._engines[name].per_block = setup, per_block
+            return True
+
+    def save_costs(self, path=None):
+        """ Writes the current cost models to 'path' (default costs_path())
+            and returns the path. Like the table file, it is written to a
+            temporary name and renamed. """
+        path = path or costs_path()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            costs = {name: {'setup': engine.setup, 'per_block': engine.per_block}
+                     for name, engine in self._engines.items() if engine.per_block is not None}
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({'version': COSTS_VERSION, 'engines': costs}, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+        return path
+
+    def calibrate(self, core, sizes=(SMALL_BLOCKS, 4096), repeats=3, path=None):
+        """ Times every automatic engine on single DES batches of each size in
+            'sizes', fits its setup and per-block cost and saves the result
+            to 'path' (default costs_path()) for later processes. Run it once
+            per machine, e.g. at install time; it takes about a second. A
+            cost file that cannot be written is skipped. """
+        with self._lock:
+            stages = [core._int_generate_subkeys(b'\x13\x34\x57\x79\x9b\xbc\xdf\xf1')]
+            small, large = sizes
+            for engine in self._engines.values():
+                if not engine.auto or not engine.available():
+                    continue
+                crypt = getattr(core, engine.ecb)
+                times = []
+                for n in sizes:
+                    data = bytes(8 * n)
+                    crypt(data, stages)  # warm up lazy imports and tables
+                    best = None
+                    for _ in range(repeats):
+                        start = time.perf_counter()
+                        crypt(data, stages)
+                        elapsed = time.perf_counter() - start
+                        best = elapsed if best is None else min(best, elapsed)
+                    times.append(best)
+                engine.per_block = max((times[1] - times[0]) / (large - small), 0.0)
+                engine.setup = max(times[0] - engine.per_block * small, 0.0)
+            self._costs_loaded = True
+        try:
+            self.save_costs(path)
+        except OSError:
+            pass
+
+    def set_cost(self, name, setup, per_block):
+        """ Sets an engine's cost model by hand. A saved cost file is no longer
+            loaded afterwards, so it cannot override the value. """
+        engine = self.get(name)
+        with self._lock:
+            engine.setup, engine.per_block = setup, per_block
+            self._costs_loaded = True
+
+
+_registry = _EngineRegistry()
+_registry.register(_Engine("reference", ALL_MODES, batch=False, ecb="_ref_ecb", block="_ref_crypt_block",
+                           auto=False))
+# The built-in estimates are typical CPython figures. NumPy has none, so it is
+# only picked automatically once calibrate() has measured it on this machine.
+_registry.register(_Engine("int", ALL_MODES, batch=False, ecb="_int_ecb", block="_int_crypt_block",
+                           setup=0.0, per_block=2.5e-5))
+_registry.register(_Engine("bitslice", ("ECB", "CBC", "CTR"), batch=True, ecb="_bitslice_ecb",
+                           setup=1.4e-3, per_block=8e-7))
+_registry.register(_Engine("numpy", ("ECB", "CBC", "CTR"), batch=True, ecb="_numpy_ecb", requires=("numpy",)))
@@ -0,0 +1,76 @@
+import mmap
+import os
+import time
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+def _map_input(f):
+    """ Maps an input file read-only. Empty files cannot be mapped, so they
+        are returned as an empty byte string. """
+    if os.fstat(f.fileno()).st_size == 0:
+        return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _crypt_file(context, src_path, dst_path, out_size, chunk_size):
+    """ Feeds 'src_path' through a streaming context in 'chunk_size' pieces and
+        writes the output into 'dst_path', which is preallocated to 'out_size'
+        bytes and trimmed to the real output length at the end. If anything
+        fails, the partly written output file is removed. Returns a tuple
+        (bytes read, bytes written, seconds).
+    """
+    if chunk_size <= 0 or chunk_size % 8 != 0:
+        raise ValueError("Chunk size must be a positive multiple of 8")
+    start = time.perf_counter()
+    with open(src_path, 'rb') as src_file:
+        dst_file = open(dst_path, 'w+b')
+        try:
+            with dst_file:
+                read, pos = _crypt_mapped(context, src_file, dst_file, out_size, chunk_size)
+        except BaseException:
+            os.remove(dst_path)
+            raise
+    return read, pos, time.perf_counter() - start
+
+
+def _crypt_mapped(context, src_file, dst_file, out_size, chunk_size):
+    src = _map_input(src_file)
+    dst_file.truncate(out_size)
+    dst = mmap.mmap(dst_file.fileno(), out_size) if out_size else None
+    try:
+        pos = 0
+        for offset in range(0, len(src), chunk_size):
+            out = context.update(src[offset:offset + chunk_size])
+            dst[pos:pos + len(out)] = out
+            pos += len(out)
+        out = context.finalize()
+        if out:
+            dst[pos:pos + len(out)] = out
+            pos += len(out)
+        read = len(src)
+    finally:
+        if dst is not None:
+            dst.flush()
+            dst.close()
+        if isinstance(src, mmap.mmap):
+            src.close()
+    dst_file.truncate(pos)
+    return read, pos
+
+
+def encrypt_file(cipher, src_path, dst_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Encrypts a file with a DES or TDES object without loading it into
+        memory. Returns a tuple (bytes read, bytes written, seconds). """
+    out_size = cipher._padded_length(cipher.mode, os.path.getsize(src_path))
+    return _crypt_file(cipher.encryptor(), src_path, dst_path, out_size, chunk_size)
+
+
+def decrypt_file(cipher, src_path, dst_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Decrypts a file with a DES or TDES object without loading it into
+        memory. The padding is removed in every padded mode, OFB included,
+        so a file always decrypts to the bytes that were encrypted; invalid
+        padding raises ValueError. Returns a tuple (bytes read, bytes
+        written, seconds). """
+    size = os.path.getsize(src_path)
+    return _crypt_file(cipher.decryptor(strict=True), src_path, dst_path, size, chunk_size)
@@ -0,0 +1,172 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from core import _Core
+from intCore import _IntCore
+from bitsliceCore import _BitsliceCore
+
+# Methods that are counted and timed, per class defining them. The _Core
+# names are the stages of the list-of-bits reference, the others the stages
+# of the integer, bitsliced and NumPy engines that the wrappers run on. The
+# NumPy engine is timed through _numpy_ecb so NumPy is not imported here.
+_TIMED = [
+    (_Core, ['_generate_subkeys', '_encrypt_block', '_f_function', '_substitute', '_permute', '_xor',
+             '_bytes_to_bit_array', '_bit_array_to_bytes']),
+    (_IntCore, ['_int_generate_subkeys', '_int_encrypt_block', '_int_crypt_block', '_ref_crypt_block',
+                '_bitslice_ecb', '_numpy_ecb', '_to_blocks', '_from_blocks', '_xor_bytes']),
+    (_BitsliceCore, ['_bs_crypt']),
+]
+
+# Mode helpers whose input size is added to the bytes processed per mode.
+# Only the outermost one on a thread counts, so CBC decryption and CTR are
+# not counted again as ECB.
+_MODES = {'_ecb': 'ECB', '_cbc_encrypt': 'CBC', '_cbc_decrypt': 'CBC', '_ofb': 'OFB', '_ctr': 'CTR'}
+
+
+class _Stats:
+    """ Call counts and times per instrumented method and bytes processed per
+        mode. 'total' is the time spent inside a method, 'self' the part of it
+        not spent in other instrumented methods, so the self times of all
+        methods add up without counting anything twice.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        """ Zeroes every counter. """
+        with self._lock:
+            self._calls = {}
+            self._bytes = {}
+
+    def _record(self, name, total, own):
+        with self._lock:
+            entry = self._calls.get(name)
+            if entry is None:
+                entry = self._calls[name] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += total
+            entry[2] += own
+
+    def _add_bytes(self, mode, nbytes):
+        with self._lock:
+            self._bytes[mode] = self._bytes.get(mode, 0) + nbytes
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def snapshot(self):
+        """ Returns the counters as a dictionary:
+              {'calls': {name: {'count', 'total_s', 'self_s'}}, 'bytes': {mode: n}} """
+        with self._lock:
+            calls = {name: {'count': count, 'total_s': total, 'self_s': own}
+                     for name, (count, total, own) in self._calls.items()}
+            return {'calls': calls, 'bytes': dict(self._bytes)}
+
+
+_stats = _Stats()
+_originals = {}
+
+
+def _timed(name, func):
+    stats = _stats
+    clock = time.perf_counter
+
+    def wrapper(*args, **kwargs):
+        stack = stats._stack()
+        stack.append(0.0)
+        start = clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            total = clock() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += total
+            stats._record(name, total, total - children)
+    wrapper.__wrapped__ = func
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def _counted(mode, func):
+    stats = _stats
+    local = stats._local
+
+    def wrapper(self, data, *args, **kwargs):
+        if getattr(local, 'in_mode', False):
+            return func(self, data, *args, **kwargs)
+        local.in_mode = True
+        try:
+            stats._add_bytes(mode, memoryview(data).nbytes)
+            return func(self, data, *args, **kwargs)
+        finally:
+            local.in_mode = False
+    wrapper.__wrapped__ = func
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def enable():
+    """ Swaps the instrumented variants of the hot-path methods into their
+        classes. Nothing is checked on the uninstrumented path, so while
+        instrumentation is disabled it costs nothing. The saved engine costs
+        are loaded first, so reading them is not timed as work. """
+    if _originals:
+        return
+    _IntCore._registry.load_costs()
+    for cls, names in _TIMED:
+        for name in names:
+            _originals[(cls, name)] = cls.__dict__[name]
+            setattr(cls, name, _timed(name, cls.__dict__[name]))
+    for name, mode in _MODES.items():
+        _originals[(_IntCore, name)] = _IntCore.__dict__[name]
+        setattr(_IntCore, name, _counted(mode, _IntCore.__dict__[name]))
+
+
+def disable():
+    """ Restores the original methods. The counters are kept. """
+    while _originals:
+        (cls, name), func = _originals.popitem()
+        setattr(cls, name, func)
+
+
+def is_enabled():
+    return bool(_originals)
+
+
+def snapshot():
+    """ Returns the current counters, see _Stats.snapshot(). """
+    return _stats.snapshot()
+
+
+def reset():
+    """ Zeroes the counters. """
+    _stats.reset()
+
+
+@contextmanager
+def instrumented(reset_stats=True):
+    """ Enables instrumentation for the duration of a with block and yields
+        the statistics object, whose snapshot() stays readable afterwards.
+        Instrumentation that was already enabled stays enabled on exit.
+
+            with instrumented() as stats:
+                DES(key, "CBC", iv).encrypt(data)
+            print(stats.snapshot())
+    """
+    was_enabled = is_enabled()
+    if reset_stats:
+        _stats.reset()
+    enable()
+    try:
+        yield _stats
+    finally:
+        if not was_enabled:
+            disable()
@@ -0,0 +1,576 @@
+import struct
+
+from core import _Core
+from bitsliceCore import _BitsliceCore
+from keySchedule import _KeySchedule, _ScheduleCache
+from engineRegistry import _registry
+from tables import get_tables
+
+_tables = get_tables()
+
+
+class _IntCore(_Core):
+    """ Integer based DES engine. A block is a 64-bit integer and each round
+        half a 32-bit integer, so a round is a handful of table lookups instead
+        of list slicing and per-bit permutations.
+    """
+    __slots__ = ()
+
+    # Byte-indexed permutation tables and SP tables, derived from the _Core
+    # lists and loaded from the table file (see tables.py)
+    _IP_TABLES = _tables['ip']
+    _FP_TABLES = _tables['fp']
+    _E_TABLES = _tables['e']
+    _PC1_TABLES = _tables['pc1']
+    _PC2_TABLES = _tables['pc2']
+    _SP_TABLES = _tables['sp']
+
+    # Key schedules shared by every cipher object, keyed by the raw key bytes
+    _schedule_cache = _ScheduleCache()
+
+    # Backends that engine= can name and the selector that picks one when
+    # engine is None
+    _registry = _registry
+
+    # A partial last batch smaller than this is left to the scalar engine
+    # instead of being bitsliced
+    _bitslice = _BitsliceCore()
+    BITSLICE_MIN_BLOCKS = 128
+
+    # Vectorized engine, created on first use of the "numpy" engine
+    _numpy = None
+
+    def _int_generate_subkeys(self, encryption_key):
+        """ Generates 16 DES subkeys from a 64-bit encryption key. The key may be
+            a bytes string or an int. Output is a 16-element list of 48-bit
+            integers, matching _generate_subkeys bit for bit.
+        """
+        if type(encryption_key) != int:
+            if len(encryption_key) < 8:
+                raise ValueError("Key must be 8 bytes long")
+            encryption_key = int.from_bytes(encryption_key[:8], byteorder='big')
+        pc1 = self._PC1_TABLES
+        keybits = 0
+        for i in range(8):
+            keybits |= pc1[i][(encryption_key >> (56 - 8 * i)) & 0xFF]
+        # Split the permuted key into two 28-bit halves
+        c = keybits >> 28
+        d = keybits & 0xFFFFFFF
+        pc2 = self._PC2_TABLES
+        subkeys = []
+        for shift in self._KEY_SHIFT:
+            # Rotate both halves to the left
+            c = ((c << shift) | (c >> (28 - shift))) & 0xFFFFFFF
+            d = ((d << shift) | (d >> (28 - shift))) & 0xFFFFFFF
+            cd = (c << 28) | d
+            subkey = 0
+            for i in range(7):
+                subkey |= pc2[i][(cd >> (48 - 8 * i)) & 0xFF]
+            subkeys.append(subkey)
+        return subkeys
+
+    def _int_triple_generate_subkeys(self, keys, Decrypt=False):
+        """ Generates the three integer subkey lists for Triple-DES. The lists
+            are laid out exactly like _triple_generate_subkeys.
+        """
+        k1, k2, k3 = [self._int_generate_subkeys(key) for key in keys[:3]]
+        if Decrypt:
+            return [k1[::-1], k2, k3[::-1]]
+        return [k1, k2[::-1], k3]
+
+    def _int_key_schedule(self, key):
+        """ Returns the encryption and decryption schedule for a DES key,
+            generating it only if it is not already cached.
+        """
+        if type(key) == int:
+            key = key.to_bytes(8, byteorder='big')
+        key = self._as_buffer(key)
+
+        def build():
+            subkeys = self._int_generate_subkeys(key)
+            return _KeySchedule([subkeys])
+        return self._schedule_cache.get(bytes(key[:8]), build)
+
+    def _int_triple_key_schedule(self, keys):
+        """ Returns the encryption and decryption schedule for a list of three
+            Triple-DES keys, generating it only if it is not already cached.
+        """
+        keys = [self._as_buffer(key) for key in keys[:3]]
+
+        def build():
+            return _KeySchedule(self._int_triple_generate_subkeys(keys))
+        return self._schedule_cache.get(b''.join(bytes(key[:8]) for key in keys[:3]), build)
+
+    def _numpy_engine(self):
+        """ Returns the shared NumPy engine, importing NumPy on first use. """
+        if _IntCore._numpy is None:
+            from numpyCore import _NumpyCore
+            _IntCore._numpy = _NumpyCore()
+        return _IntCore._numpy
+
+    def _check_engine(self, engine):
+        """ Raises an error unless 'engine' names an available backend. None
+            lets the registry pick one per call from the mode and size. """
+        if engine is not None:
+            self._registry.get(engine)
+
+    def _block_function(self, engine):
+        """ Returns the scalar function used by the chained modes, CBC
+            encryption and OFB. Batch-only engines fall back to the integer
+            engine there. """
+        if engine is not None:
+            block = self._registry.get(engine).block
+            if block is not None:
+                return getattr(self, block)
+        return self._int_crypt_block
+
+    def _check_iv(self, iv):
+        """ Raises an error unless 'iv' is an 8-byte bytes-like object. """
+        if iv is None:
+            raise ValueError("IV is None")
+        if not self._isInstance(iv, bytes):
+            raise TypeError("IV must be a bytes-like object")
+        if len(self._as_buffer(iv)) != 8:
+            raise ValueError("IV must be 8 bytes long")
+
+    def _padded_length(self, mode, length):
+        """ Returns the ciphertext length for 'length' bytes of plaintext.
+            Padding always adds one to eight bytes, except in CTR mode. """
+        if mode == "CTR":
+            return length
+        return length - length % 8 + 8
+
+    def _encrypt_mode(self, mode, data, schedule, iv=None, engine=None):
+        """ Pads and encrypts 'data' in the given block mode with a
+            precomputed key schedule. 'engine' selects the backend used for
+            independent blocks. """
+        if mode == "ECB":
+            return self._ecb(self._add_padding(data), schedule.encrypt, engine)
+        elif mode == "CBC":
+            return self._cbc_encrypt(self._add_padding(data), schedule.encrypt, iv, engine)
+        elif mode == "OFB":
+            return self._ofb(self._add_padding(data), schedule.encrypt, iv, engine)
+        elif mode == "CTR":
+            return self._ctr(data, schedule.encrypt, iv, engine)
+        raise ValueError("Invalid mode: " + mode)
+
+    def _decrypt_mode(self, mode, data, schedule, iv=None, engine=None):
+        """ Decrypts 'data' in the given block mode with a precomputed key
+            schedule. Padding is removed for ECB and CBC. 'engine' selects the
+            backend used for independent blocks. """
+        if mode == "ECB":
+            return self._rem_padding(self._ecb(data, schedule.decrypt, engine))
+        elif mode == "CBC":
+            return self._rem_padding(self._cbc_decrypt(data, schedule.decrypt, iv, engine))
+        elif mode == "OFB":
+            return self._ofb(data, schedule.encrypt, iv, engine)
+        elif mode == "CTR":
+            return self._ctr(data, schedule.encrypt, iv, engine)
+        raise ValueError("Invalid mode: " + mode)
+
+    def _decrypt_range(self, mode, data, schedule, iv, start, end=None, engine=None):
+        """ Returns plaintext[start:end] of the ciphertext 'data', where
+            plaintext is the message that was encrypted, decrypting only the
+            blocks covering the range. CBC needs the one ciphertext block
+            before the range, CTR starts its counter at the first block, and
+            OFB advances the feedback register to the first block without
+            producing keystream for the blocks skipped. The padding is only
+            read when the range reaches the last block. """
+        data = self._as_buffer(data)
+        size = len(data)
+        end = size if end is None else min(end, size)
+        if start < 0 or end < 0:
+            raise ValueError("Range offsets must not be negative")
+        if start >= end:
+            return b''
+        first = start - start % 8
+        if mode == "CTR":
+            return self._ctr(data[first:end], schedule.encrypt, iv, engine, first // 8)[start - first:]
+        if size % 8 != 0:
+            raise ValueError("Ciphertext length must be a multiple of 8 bytes")
+        # A range ending in the last block needs that block for the padding
+        stop = size if end > size - 8 else end + (-end) % 8
+        chunk = data[first:stop]
+        if mode == "ECB":
+            plain = self._ecb(chunk, schedule.decrypt, engine)
+        elif mode == "CBC":
+            prev = iv if first == 0 else data[first - 8:first]
+            plain = self._cbc_decrypt(chunk, schedule.decrypt, prev, engine)
+        elif mode == "OFB":
+            plain = self._ofb(chunk, schedule.encrypt, self._ofb_seek(schedule.encrypt, iv, first // 8, engine), engine)
+        else:
+            raise ValueError("Invalid mode: " + mode)
+        if stop == size:
+            plain = self._rem_padding(plain)
+        return plain[start - first:end - first]
+
+    def _int_encrypt_block(self, block, subkeys):
+        """ Encrypts a single 64-bit integer block with the DES algorithm using a
+            list of 16 integer subkeys. Passing the subkeys reversed decrypts.
+        """
+        ip0, ip1, ip2, ip3, ip4, ip5, ip6, ip7 = self._IP_TABLES
+        e0, e1, e2, e3 = self._E_TABLES
+        s0, s1, s2, s3, s4, s5, s6, s7 = self._SP_TABLES
+        # Initial permutation
+        block = (ip0[block >> 56] | ip1[(block >> 48) & 0xFF] |
+                 ip2[(block >> 40) & 0xFF] | ip3[(block >> 32) & 0xFF] |
+                 ip4[(block >> 24) & 0xFF] | ip5[(block >> 16) & 0xFF] |
+                 ip6[(block >> 8) & 0xFF] | ip7[block & 0xFF])
+        left = block >> 32
+        right = block & 0xFFFFFFFF
+        # Perform 16 rounds of DES
+        for key in subkeys:
+            e = (e0[right >> 24] | e1[(right >> 16) & 0xFF] |
+                 e2[(right >> 8) & 0xFF] | e3[right & 0xFF]) ^ key
+            left, right = right, left ^ (
+                s0[e >> 42] | s1[(e >> 36) & 0x3F] | s2[(e >> 30) & 0x3F] |
+                s3[(e >> 24) & 0x3F] | s4[(e >> 18) & 0x3F] | s5[(e >> 12) & 0x3F] |
+                s6[(e >> 6) & 0x3F] | s7[e & 0x3F])
+        # Undo the last swap and apply the final permutation
+        block = (right << 32) | left
+        fp0, fp1, fp2, fp3, fp4, fp5, fp6, fp7 = self._FP_TABLES
+        return (fp0[block >> 56] | fp1[(block >> 48) & 0xFF] |
+                fp2[(block >> 40) & 0xFF] | fp3[(block >> 32) & 0xFF] |
+                fp4[(block >> 24) & 0xFF] | fp5[(block >> 16) & 0xFF] |
+                fp6[(block >> 8) & 0xFF] | fp7[block & 0xFF])
+
+    def _int_crypt_block(self, block, stages):
+        """ Runs a block through one DES pass per subkey list in 'stages'. A
+            single stage is plain DES, three stages are Triple-DES. The FP at
+            the end of a pass is undone by the IP at the start of the next, so
+            IP and FP are applied once and the passes are joined by swapping
+            the halves, which is all that is left of the FP/IP pair.
+        """
+        if len(stages) == 1:
+            return self._int_encrypt_block(block, stages[0])
+        ip0, ip1, ip2, ip3, ip4, ip5, ip6, ip7 = self._IP_TABLES
+        e0, e1, e2, e3 = self._E_TABLES
+        s0, s1, s2, s3, s4, s5, s6, s7 = self._SP_TABLES
+        block = (ip0[block >> 56] | ip1[(block >> 48) & 0xFF] |
+                 ip2[(block >> 40) & 0xFF] | ip3[(block >> 32) & 0xFF] |
+                 ip4[(block >> 24) & 0xFF] | ip5[(block >> 16) & 0xFF] |
+                 ip6[(block >> 8) & 0xFF] | ip7[block & 0xFF])
+        left = block >> 32
+        right = block & 0xFFFFFFFF
+        for subkeys in stages:
+            for key in subkeys:
+                e = (e0[right >> 24] | e1[(right >> 16) & 0xFF] |
+                     e2[(right >> 8) & 0xFF] | e3[right & 0xFF]) ^ key
+                left, right = right, left ^ (
+                    s0[e >> 42] | s1[(e >> 36) & 0x3F] | s2[(e >> 30) & 0x3F] |
+                    s3[(e >> 24) & 0x3F] | s4[(e >> 18) & 0x3F] | s5[(e >> 12) & 0x3F] |
+                    s6[(e >> 6) & 0x3F] | s7[e & 0x3F])
+            # Undo the last swap of the pass
+            left, right = right, left
+        block = (left << 32) | right
+        fp0, fp1, fp2, fp3, fp4, fp5, fp6, fp7 = self._FP_TABLES
+        return (fp0[block >> 56] | fp1[(block >> 48) & 0xFF] |
+                fp2[(block >> 40) & 0xFF] | fp3[(block >> 32) & 0xFF] |
+                fp4[(block >> 24) & 0xFF] | fp5[(block >> 16) & 0xFF] |
+                fp6[(block >> 8) & 0xFF] | fp7[block & 0xFF])
+
+    def _ref_crypt_block(self, block, stages):
+        """ Runs an integer block through the list-of-bits reference
+            implementation, one _encrypt_block call per stage. Slow; it backs
+            the "reference" engine used to cross-check the others.
+        """
+        bits = [(block >> (63 - i)) & 1 for i in range(64)]
+        for subkeys in stages:
+            bits = self._encrypt_block(bits, [[(k >> (47 - j)) & 1 for j in range(48)] for k in subkeys])
+        return int(''.join(str(bit) for bit in bits), 2)
+
+    def _as_buffer(self, data):
+        """ Returns 'data' as a flat byte buffer without copying when possible.
+            bytes pass through unchanged and any other buffer-protocol object
+            (bytearray, memoryview, mmap, NumPy array) becomes a byte
+            memoryview of the same memory.
+        """
+        if type(data) == bytes:
+            return data
+        view = memoryview(data)
+        if not view.contiguous:
+            return view.tobytes()
+        if view.format != 'B' or view.ndim != 1:
+            view = view.cast('B')
+        return view
+
+    def _to_blocks(self, data):
+        """ Converts a byte string whose length is a multiple of eight into a
+            tuple of 64-bit integers. """
+        if len(data) % 8 != 0:
+            raise ValueError("Data length must be a multiple of 8 bytes")
+        return struct.unpack('>%dQ' % (len(data) // 8), data)
+
+    def _from_blocks(self, blocks):
+        """ Converts a list of 64-bit integers back into a byte string. """
+        return struct.pack('>%dQ' % len(blocks), *blocks)
+
+    def _int_ecb(self, data, stages):
+        """ Runs every block of 'data' through the scalar engine independently. """
+        crypt = self._int_crypt_block
+        return self._from_blocks([crypt(block, stages) for block in self._to_blocks(data)])
+
+    def _ref_ecb(self, data, stages):
+        """ Runs every block of 'data' through the reference implementation. """
+        crypt = self._ref_crypt_block
+        return self._from_blocks([crypt(block, stages) for block in self._to_blocks(data)])
+
+    def _bitslice_ecb(self, data, stages):
+        """ Runs every block of 'data' through the bitsliced engine. A last
+            partial batch too small to be worth transposing goes through the
+            scalar engine instead. """
+        nblocks = len(data) // 8
+        bulk = nblocks
+        if nblocks > self._bitslice.BATCH_BLOCKS and nblocks % self._bitslice.BATCH_BLOCKS < self.BITSLICE_MIN_BLOCKS:
+            bulk -= nblocks % self._bitslice.BATCH_BLOCKS
+        return (self._bitslice._bs_crypt(data[:8 * bulk], stages) +
+                self._int_ecb(data[8 * bulk:], stages))
+
+    def _numpy_ecb(self, data, stages):
+        """ Runs every block of 'data' through the vectorized NumPy engine. """
+        return self._numpy_engine()._np_crypt(data, stages)
+
+    def _ecb(self, data, stages, engine=None, mode="ECB"):
+        """ Runs every block of 'data' through the cipher independently, on
+            the named engine or, if 'engine' is None, on the one the registry
+            selects for 'mode' and the number of blocks.
+        """
+        data = self._as_buffer(data)
+        if len(data) % 8 != 0:
+            raise ValueError("Data length must be a multiple of 8 bytes")
+        if engine is None:
+            selected = self._registry.select(self, mode, len(data) // 8)
+        else:
+            selected = self._registry.get(engine)
+        return getattr(self, selected.ecb)(data, stages)
+
+    def _keyed_ecb(self, data, lane_keys, decrypt=False):
+        """ Runs every block of 'data' through the cipher under its own key.
+            'lane_keys' has one entry per DES key of the cipher (one for DES,
+            three for Triple-DES), each holding an 8-byte key per block of
+            'data'. Large batches are bitsliced with a key per lane; small
+            ones use the scalar engine with one schedule per distinct key.
+        """
+        data = self._as_buffer(data)
+        if len(data) % 8 != 0:
+            raise ValueError("Data length must be a multiple of 8 bytes")
+        # Encryption alternates E, D, E; decryption runs the passes backwards
+        stages = [(keys, i % 2 == 1) for i, keys in enumerate(lane_keys)]
+        if decrypt:
+            stages = [(keys, not backwards) for keys, backwards in reversed(stages)]
+        nblocks = len(data) // 8
+        if nblocks >= self._registry.SMALL_BLOCKS:
+            return self._bitslice._bs_crypt_keyed(data, stages)
+        schedules = {}
+        crypt = self._int_crypt_block
+        result = []
+        for i, block in enumerate(self._to_blocks(data)):
+            keys = tuple(bytes(keys[8 * i:8 * i + 8]) for keys, _ in stages)
+            schedule = schedules.get(keys)
+            if schedule is None:
+                schedule = schedules[keys] = [self._int_generate_subkeys(key)[::-1] if backwards
+                                              else self._int_generate_subkeys(key)
+                                              for key, (_, backwards) in zip(keys, stages)]
+            result.append(crypt(block, schedule))
+        return self._from_blocks(result)
+
+    def _keyed_cbc_encrypt(self, streams, keys, ivs, nkeys=1):
+        """ CBC-encrypts streams[i] (block aligned) under keys[i] (8 * nkeys
+            bytes) with ivs[i] for every i. CBC is serial within a stream, so
+            many streams are advanced in lockstep by the bitsliced engine with
+            a key per lane; a few streams run one after the other on the
+            scalar engine. Returns the list of ciphertexts.
+        """
+        # Encryption alternates E, D, E
+        stages = [(b''.join(bytes(key[8 * j:8 * j + 8]) for key in keys), j % 2 == 1) for j in range(nkeys)]
+        if len(streams) >= self._registry.SMALL_BLOCKS:
+            return self._bitslice._bs_cbc_keyed(streams, stages, ivs)
+        result = []
+        for i, (stream, iv) in enumerate(zip(streams, ivs)):
+            schedule = [self._int_generate_subkeys(lane_keys[8 * i:8 * i + 8])[::-1] if backwards
+                        else self._int_generate_subkeys(lane_keys[8 * i:8 * i + 8])
+                        for lane_keys, backwards in stages]
+            result.append(self._cbc_encrypt(stream, schedule, iv))
+        return result
+
+    def _cbc_encrypt(self, data, stages, iv, engine=None):
+        """ CBC encryption of block aligned data with an 8-byte IV. """
+        data = self._as_buffer(data)
+        crypt = self._block_function(engine)
+        prev = int.from_bytes(iv, byteorder='big')
+        result = []
+        for block in self._to_blocks(data):
+            prev = crypt(block ^ prev, stages)
+            result.append(prev)
+        return self._from_blocks(result)
+
+    def _cbc_decrypt(self, data, stages, iv, engine=None):
+        """ CBC decryption of block aligned data with an 8-byte IV. 'stages'
+            must already be the decryption schedule. Every block only depends
+            on its own ciphertext, so all of them are decrypted as one ECB
+            batch and then XORed with the preceding ciphertext blocks.
+        """
+        data = self._as_buffer(data)
+        if len(data) == 0:
+            return b''
+        decrypted = self._ecb(data, stages, engine, "CBC")
+        chained = bytes(iv) + data[:-8]
+        result = int.from_bytes(decrypted, byteorder='big') ^ int.from_bytes(chained, byteorder='big')
+        return result.to_bytes(len(data), byteorder='big')
+
+    def _mac_pad(self, data, padding):
+        """ Pads data for a MAC with ISO/IEC 9797-1 padding method 1 (zero
+            bytes up to a whole block, at least one block) or method 2 (a 0x80
+            byte, then zero bytes). Method 1 does not tell messages ending in
+            zero bytes apart, so it is only safe for fixed-length messages. """
+        data = self._as_buffer(data)
+        if padding == 1:
+            if len(data) % 8 == 0 and len(data) > 0:
+                return bytes(data)
+            return bytes(data) + b'\x00' * (8 - len(data) % 8)
+        if padding == 2:
+            return bytes(data) + b'\x80' + b'\x00' * (7 - len(data) % 8)
+        raise ValueError("Padding must be ISO 9797-1 method 1 or 2")
+
+    def _mac_stages(self, key, algorithm):
+        """ Returns (chain stages, final stages or None) for a MAC key.
+              "cbc"    - CBC-MAC (ISO 9797-1 algorithm 1) with an 8-byte DES
+                         key or a 16/24-byte Triple-DES key
+              "retail" - Retail MAC (ISO 9797-1 algorithm 3, ANSI X9.19)
+                         with a 16-byte key K || K': the chain uses DES with
+                         K and the last block is then decrypted with K' and
+                         encrypted again with K """
+        if key is None:
+            raise ValueError("MAC key is None")
+        key = self._as_buffer(key)
+        if algorithm == "cbc":
+            if len(key) == 8:
+                return self._int_key_schedule(key).encrypt, None
+            if len(key) in (16, 24):
+                keys = [key[:8], key[8:16], key[:8] if len(key) == 16 else key[16:24]]
+                return self._int_triple_key_schedule(keys).encrypt, None
+            raise ValueError("CBC-MAC keys must be 8, 16 or 24 bytes long")
+        if algorithm == "retail":
+            if len(key) != 16:
+                raise ValueError("Retail MAC keys must be 16 bytes long")
+            k1 = self._int_key_schedule(key[:8]).encrypt
+            return k1, self._int_key_schedule(key[8:16]).decrypt + k1
+        raise ValueError("Invalid MAC algorithm: " + algorithm)
+
+    def _mac_tag(self, chain, final, size):
+        """ Applies the output transformation of the MAC algorithm to the
+            last chaining value and truncates the tag to 'size' bytes. """
+        if not 1 <= size <= 8:
+            raise ValueError("MAC size must be between 1 and 8 bytes")
+        if final is not None:
+            chain = self._int_crypt_block(chain, final)
+        return chain.to_bytes(8, byteorder='big')[:size]
+
+    def _mac(self, data, key, algorithm="retail", padding=1, size=8):
+        """ Returns the CBC-MAC or Retail MAC of 'data'. """
+        stages, final = self._mac_stages(key, algorithm)
+        crypt = self._int_crypt_block
+        chain = 0
+        for block in self._to_blocks(self._mac_pad(data, padding)):
+            chain = crypt(block ^ chain, stages)
+        return self._mac_tag(chain, final, size)
+
+    def _cbc_encrypt_mac(self, data, stages, iv, mac_key, algorithm="retail", padding=1, size=8, engine=None):
+        """ CBC-encrypts 'data' (padded like encrypt()) and computes the MAC
+            of the plaintext in the same pass. Both chains advance block by
+            block over one conversion of the input, so the plaintext is read
+            and split into integers once instead of once per pass. Returns
+            (ciphertext, tag). """
+        data = self._as_buffer(data)
+        mac_stages, final = self._mac_stages(mac_key, algorithm)
+        full = len(data) - len(data) % 8
+        # The two paddings differ, so only the whole blocks are shared
+        enc_tail = self._add_padding(data[full:])
+        if padding == 1 and full and full == len(data):
+            mac_tail = b''
+        else:
+            mac_tail = self._mac_pad(data[full:], padding)
+        crypt = self._block_function(engine)
+        prev = int.from_bytes(iv, byteorder='big')
+        chain = 0
+        result = []
+        for block in self._to_blocks(data[:full]):
+            prev = crypt(block ^ prev, stages)
+            result.append(prev)
+            chain = crypt(block ^ chain, mac_stages)
+        for block in self._to_blocks(enc_tail):
+            prev = crypt(block ^ prev, stages)
+            result.append(prev)
+        for block in self._to_blocks(mac_tail):
+            chain = crypt(block ^ chain, mac_stages)
+        return self._from_blocks(result), self._mac_tag(chain, final, size)
+
+    def _xor_bytes(self, data, keystream):
+        """ XORs 'data' with the first len(data) bytes of 'keystream' in one
+            integer operation. """
+        length = len(data)
+        result = int.from_bytes(data, byteorder='big') ^ int.from_bytes(keystream[:length], byteorder='big')
+        return result.to_bytes(length, byteorder='big')
+
+    def _ofb_keystream(self, stages, iv, nblocks, engine=None):
+        """ Returns 'nblocks' blocks of OFB keystream following the feedback
+            block 'iv'. The keystream does not depend on the data, so it can be
+            generated ahead of time or reused.
+        """
+        crypt = self._block_function(engine)
+        feedback = int.from_bytes(iv, byteorder='big')
+        result = []
+        for _ in range(nblocks):
+            feedback = crypt(feedback, stages)
+            result.append(feedback)
+        return self._from_blocks(result)
+
+    def _ofb_seek(self, stages, iv, nblocks, engine=None):
+        """ Returns the OFB feedback block after 'nblocks' blocks of keystream,
+            from which the keystream of the following blocks continues. The
+            blocks skipped still have to be encrypted, but nothing is stored
+            or XORed. """
+        crypt = self._block_function(engine)
+        feedback = int.from_bytes(iv, byteorder='big')
+        for _ in range(nblocks):
+            feedback = crypt(feedback, stages)
+        return feedback.to_bytes(8, byteorder='big')
+
+    def _ofb(self, data, stages, iv, engine=None):
+        """ XORs 'data' with the OFB keystream for 'iv'. A trailing partial block
+            only uses as much keystream as it needs.
+        """
+        data = self._as_buffer(data)
+        return self._xor_bytes(data, self._ofb_keystream(stages, iv, (len(data) + 7) // 8, engine))
+
+    def _ctr_keystream(self, stages, iv, start_block, nblocks, engine=None):
+        """ Returns 'nblocks' blocks of CTR keystream starting at block number
+            'start_block'. Block i encrypts the 64-bit counter iv + i, so any
+            part of the keystream can be computed on its own and in a single
+            batch of independent blocks.
+        """
+        counter = int.from_bytes(iv, byteorder='big') + start_block
+        counters = [(counter + i) & 0xFFFFFFFFFFFFFFFF for i in range(nblocks)]
+        return self._ecb(self._from_blocks(counters), stages, engine, "CTR")
+
+    def _ctr(self, data, stages, iv, engine=None, start_block=0):
+        """ XORs 'data' with the CTR keystream for 'iv', starting at block
+            number 'start_block'. No padding is needed; a trailing partial
+            block only uses as much keystream as it needs.
+        """
+        data = self._as_buffer(data)
+        keystream = self._ctr_keystream(stages, iv, start_block, (len(data) + 7) // 8, engine)
+        return self._xor_bytes(data, keystream)
+
+    def _run_unit_tests(self):
+        """ Runs the _Core unit tests and checks that the integer engine agrees
+            with the list-of-bits reference implementation.
+        """
+        key = b"\xEF\x00\xEF\x00\xFF\x80\xFF\x80"
+        subkeys = self._generate_subkeys(key)
+        int_subkeys = self._int_generate_subkeys(key)
+        assert [int(''.join(str(b) for b in k), 2) for k in subkeys] == int_subkeys
+        block = b"\x01\x23\x45\x67\x89\xAB\xCD\xEF"
+        expected = self._bit_array_to_bytes(self._encrypt_block(self._bytes_to_bit_array(block), subkeys))
+        assert self._int_encrypt_block(int.from_bytes(block, 'big'), int_subkeys).to_bytes(8, 'big') == expected
+        _Core._run_unit_tests(self)
@@ -0,0 +1,98 @@
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+
+
+class _KeySchedule:
+    """ Precomputed subkeys for one DES or Triple-DES key, stored compactly as
+        a single array of 48-bit integers, 16 per DES pass. Both properties
+        are lists of stages in the order they are applied to a block, where
+        each stage is a view of 16 integer subkeys:
+          encrypt - stages used to encrypt (and to generate OFB keystream)
+          decrypt - stages used to decrypt: the same array walked backwards
+        The views share the array's memory, so the decryption order costs no
+        second copy of the subkeys.
+    """
+    __slots__ = ('_subkeys',)
+
+    def __init__(self, stages):
+        self._subkeys = array('Q', [subkey for subkeys in stages for subkey in subkeys])
+
+    @property
+    def nstages(self):
+        """ Number of DES passes: 1 for DES, 3 for Triple-DES. """
+        return len(self._subkeys) // 16
+
+    @staticmethod
+    def _stages(view):
+        return [view[i:i + 16] for i in range(0, len(view), 16)]
+
+    @property
+    def encrypt(self):
+        return self._stages(memoryview(self._subkeys))
+
+    @property
+    def decrypt(self):
+        return self._stages(memoryview(self._subkeys)[::-1])
+
+    def sizeof(self):
+        """ Returns the bytes used by the schedule and its subkey array. """
+        return sys.getsizeof(self) + sys.getsizeof(self._subkeys)
+
+
+class _ScheduleCache:
+    """ Bounded least-recently-used cache of key schedules keyed by the raw key
+        bytes. Keeps hit and miss counters so the cache size can be tuned.
+    """
+
+    def __init__(self, maxsize=128):
+        if maxsize < 0:
+            raise ValueError("Cache size must not be negative")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        """ Returns the schedule cached under 'key', calling factory() to build
+            and store it on a miss. """
+        with self._lock:
+            schedule = self._entries.get(key)
+            if schedule is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return schedule
+            self.misses += 1
+        schedule = factory()
+        with self._lock:
+            if self.maxsize > 0:
+                self._entries[key] = schedule
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return schedule
+
+    def resize(self, maxsize):
+        """ Changes the maximum number of cached schedules, evicting the least
+            recently used entries if needed. """
+        if maxsize < 0:
+            raise ValueError("Cache size must not be negative")
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._entries) > maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """ Drops every cached schedule and resets the counters. """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """ Returns the cache statistics as a dictionary. """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._entries), 'maxsize': self.maxsize}
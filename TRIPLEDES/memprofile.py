@@ -0,0 +1,377 @@
+""" Memory profiling of the _DES and _TripleDES operations.
+
+    python memprofile.py [--sizes 64 1024 8192] [--operations encryptCBC ...]
+                         [--engine reference] [--stages] [--json]
+
+    While profiling is enabled, every public operation of _DES/_TripleDES, the
+    encrypt()/decrypt() of the DES and TDES wrappers (as "encrypt CBC", ...) and
+    every stage listed in instrument.py is wrapped so that tracemalloc
+    records the peak memory it allocated above the memory in use when it was
+    called, including what its callees allocated. Peaks are kept per
+    operation and per stage, together with the largest number of extra
+    memory blocks alive at a stage boundary (sys.getallocatedblocks(), so
+    'peak_live_blocks' is a high-water mark of live objects, not a count of
+    allocations; tracemalloc cannot count those) and, for operations, the
+    peak per input byte. The command line runs each
+    operation on payloads of every size to show how memory scales.
+
+    tracemalloc counts memory globally, so profile one thread at a time, and
+    it slows the integer engines down by an order of magnitude or more, so
+    keep the payloads small; peaks grow linearly with the payload anyway.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+import instrument
+from instrument import _TIMED, _MODES
+from intCore import _IntCore
+from desCore import _DES
+from tDesCore import _TripleDES
+
+# Public operations: name -> (class, key, needs an IV, MAC key, inverse).
+# The key is 8 bytes for _DES, three 8-byte keys for _TripleDES and 16
+# bytes for the Retail MAC; decryption runs on the inverse's output.
+OPERATIONS = {
+    'encryptECB': (_DES, 8, False, False, None),
+    'decryptECB': (_DES, 8, False, False, 'encryptECB'),
+    'encryptCBC': (_DES, 8, True, False, None),
+    'decryptCBC': (_DES, 8, True, False, 'encryptCBC'),
+    'encryptOFB': (_DES, 8, True, False, None),
+    'decryptOFB': (_DES, 8, True, False, 'encryptOFB'),
+    'encryptCTR': (_DES, 8, True, False, None),
+    'decryptCTR': (_DES, 8, True, False, 'encryptCTR'),
+    'macCBC': (_DES, 8, False, False, None),
+    'macRetail': (_DES, 16, False, False, None),
+    'encryptCBCAndMAC': (_DES, 8, True, True, None),
+    'tEncryptECB': (_TripleDES, 24, False, False, None),
+    'tDecryptECB': (_TripleDES, 24, False, False, 'tEncryptECB'),
+    'tEncryptCBC': (_TripleDES, 24, True, False, None),
+    'tDecryptCBC': (_TripleDES, 24, True, False, 'tEncryptCBC'),
+    'tEncryptOFB': (_TripleDES, 24, True, False, None),
+    'tDecryptOFB': (_TripleDES, 24, True, False, 'tEncryptOFB'),
+    'tEncryptCTR': (_TripleDES, 24, True, False, None),
+    'tDecryptCTR': (_TripleDES, 24, True, False, 'tEncryptCTR'),
+    'tMacCBC': (_TripleDES, 24, False, False, None),
+    'tEncryptCBCAndMAC': (_TripleDES, 24, True, True, None),
+}
+
+# The block-mode entry points of the DES and TDES wrappers and the contexts,
+# recorded per mode as "encrypt CBC", "decrypt CTR", ...
+_ENTRY_POINTS = {'_encrypt_mode': 'encrypt', '_decrypt_mode': 'decrypt'}
+
+SIZES = [64, 1 << 10, 1 << 13]
+SEED = 1234
+
+
+class _MemoryStats:
+    """ Peak traced memory and memory blocks per operation and per stage.
+        Each call pushes a frame holding the memory and block count on
+        entry and the largest values seen so far; tracemalloc's peak is
+        reset on every call and folded into the caller's frame on return,
+        so nested stages do not hide each other's peaks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        """ Forgets every recorded peak. """
+        with self._lock:
+            self._operations = {}
+            self._stages = {}
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self):
+        stack = self._stack()
+        current, peak = tracemalloc.get_traced_memory()
+        blocks = sys.getallocatedblocks()
+        if stack:
+            parent = stack[-1]
+            parent[2] = max(parent[2], peak)
+            parent[3] = max(parent[3], blocks)
+        # memory on entry, blocks on entry, peak memory, peak blocks
+        stack.append([current, blocks, current, blocks])
+        tracemalloc.reset_peak()
+
+    def _exit(self):
+        """ Pops the current frame and returns (peak bytes, peak blocks)
+            above the values on entry. """
+        stack = self._stack()
+        frame = stack.pop()
+        peak = max(frame[2], tracemalloc.get_traced_memory()[1])
+        blocks = max(frame[3], sys.getallocatedblocks())
+        if stack:
+            stack[-1][2] = max(stack[-1][2], peak)
+            stack[-1][3] = max(stack[-1][3], blocks)
+        return peak - frame[0], blocks - frame[1]
+
+    def _record(self, table, name, peak, blocks, nbytes=0):
+        with self._lock:
+            entry = table.get(name)
+            if entry is None:
+                entry = table[name] = {'calls': 0, 'peak_bytes': 0, 'peak_live_blocks': 0, 'input_bytes': 0}
+            entry['calls'] += 1
+            if peak >= entry['peak_bytes']:
+                entry['peak_bytes'] = peak
+                entry['input_bytes'] = nbytes
+            entry['peak_live_blocks'] = max(entry['peak_live_blocks'], blocks)
+
+    def snapshot(self):
+        """ Returns the peaks as a dictionary:
+              {'operations': {name: {'calls', 'peak_bytes', 'peak_live_blocks',
+                                     'input_bytes', 'peak_per_input_byte'}},
+               'stages': {name: {'calls', 'peak_bytes', 'peak_live_blocks'}}}
+            'input_bytes' is the input size of the call with the largest peak.
+        """
+        with self._lock:
+            operations = {}
+            for name, entry in self._operations.items():
+                entry = dict(entry)
+                entry['peak_per_input_byte'] = (entry['peak_bytes'] / entry['input_bytes']
+                                                if entry['input_bytes'] else None)
+                operations[name] = entry
+            stages = {name: {key: value for key, value in entry.items() if key != 'input_bytes'}
+                      for name, entry in self._stages.items()}
+            return {'operations': operations, 'stages': stages}
+
+
+_stats = _MemoryStats()
+_originals = {}
+_started_tracing = False
+
+
+def _stage(name, func):
+    stats = _stats
+
+    def wrapper(*args, **kwargs):
+        stats._enter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            peak, blocks = stats._exit()
+            stats._record(stats._stages, name, peak, blocks)
+    wrapper.__wrapped__ = func
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def _operation(name, func):
+    stats = _stats
+    local = stats._local
+
+    def wrapper(self, data, *args, **kwargs):
+        # Operations built on other operations (decryptCTR) count once
+        if getattr(local, 'in_operation', False):
+            return func(self, data, *args, **kwargs)
+        local.in_operation = True
+        nbytes = memoryview(data).nbytes
+        stats._enter()
+        try:
+            return func(self, data, *args, **kwargs)
+        finally:
+            peak, blocks = stats._exit()
+            local.in_operation = False
+            stats._record(stats._operations, name, peak, blocks, nbytes)
+    wrapper.__wrapped__ = func
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def _entry_point(name, func):
+    """ Wraps _encrypt_mode or _decrypt_mode, recorded as e.g. "encrypt CBC". """
+    operations = {}
+
+    def wrapper(self, mode, data, *args, **kwargs):
+        operation = operations.get(mode)
+        if operation is None:
+            operation = operations[mode] = _operation('%s %s' % (name, mode),
+                                                      lambda self, data, *args, **kwargs:
+                                                      func(self, mode, data, *args, **kwargs))
+        return operation(self, data, *args, **kwargs)
+    wrapper.__wrapped__ = func
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def enable():
+    """ Starts tracemalloc if needed and swaps the profiling wrappers into
+        the classes. Cannot be combined with instrument.py's timing. """
+    global _started_tracing
+    if _originals:
+        return
+    if instrument.is_enabled():
+        raise RuntimeError("Disable instrument.py timing before profiling memory")
+    # Otherwise reading the saved engine costs is profiled with the first call
+    _IntCore._registry.load_costs()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracing = True
+    stages = [(cls, names) for cls, names in _TIMED] + [(_IntCore, list(_MODES))]
+    for cls, names in stages:
+        for name in names:
+            _originals[(cls, name)] = cls.__dict__[name]
+            setattr(cls, name, _stage(name, cls.__dict__[name]))
+    for name, (cls, *_) in OPERATIONS.items():
+        _originals[(cls, name)] = cls.__dict__[name]
+        setattr(cls, name, _operation(name, cls.__dict__[name]))
+    for name, prefix in _ENTRY_POINTS.items():
+        _originals[(_IntCore, name)] = _IntCore.__dict__[name]
+        setattr(_IntCore, name, _entry_point(prefix, _IntCore.__dict__[name]))
+
+
+def disable():
+    """ Restores the original methods and stops tracemalloc if enable()
+        started it. The recorded peaks are kept. """
+    global _started_tracing
+    while _originals:
+        (cls, name), func = _originals.popitem()
+        setattr(cls, name, func)
+    if _started_tracing:
+        tracemalloc.stop()
+        _started_tracing = False
+
+
+def is_enabled():
+    return bool(_originals)
+
+
+def snapshot():
+    """ Returns the recorded peaks, see _MemoryStats.snapshot(). """
+    return _stats.snapshot()
+
+
+def reset():
+    """ Forgets the recorded peaks. """
+    _stats.reset()
+
+
+@contextmanager
+def memory_profiled(reset_stats=True):
+    """ Enables memory profiling for the duration of a with block and yields
+        the statistics object, whose snapshot() stays readable afterwards.
+
+            with memory_profiled() as stats:
+                _DES().encryptCBC(data, key, iv)
+            print(stats.snapshot()['operations']['encryptCBC'])
+    """
+    was_enabled = is_enabled()
+    if reset_stats:
+        _stats.reset()
+    enable()
+    try:
+        yield _stats
+    finally:
+        if not was_enabled:
+            disable()
+
+
+def _pinned(cls, engine):
+    """ Returns a subclass of 'cls' whose block modes always run on 'engine',
+        since the _DES/_TripleDES operations leave the choice to the
+        registry. None returns 'cls' itself. """
+    if engine is None:
+        return cls
+    _IntCore._registry.get(engine)
+
+    class Pinned(cls):
+        def _ecb(self, data, stages, _engine=None, mode="ECB"):
+            return cls._ecb(self, data, stages, engine, mode)
+
+        def _block_function(self, _engine):
+            return cls._block_function(self, engine)
+    return Pinned
+
+
+def _arguments(name, rng):
+    """ Returns the key, IV and MAC key arguments of an operation. """
+    cls, key_size, needs_iv, needs_mac_key, _ = OPERATIONS[name]
+    if cls is _TripleDES:
+        args = [[rng.randbytes(8) for _ in range(3)]]
+    else:
+        args = [rng.randbytes(key_size)]
+    if needs_iv:
+        args.append(rng.randbytes(8))
+    if needs_mac_key:
+        args.append(rng.randbytes(16))
+    return args
+
+
+def profile_sizes(operations=None, sizes=SIZES, engine=None, seed=SEED):
+    """ Runs every operation once per payload size under the profiler and
+        returns one row per run with the operation's peak memory, peak
+        live blocks, peak per input byte and the peak of every stage it went
+        through. 'engine' forces a backend, e.g. "reference" for the
+        list-of-bits path. """
+    rows = []
+    for name in operations or list(OPERATIONS):
+        cls, _, _, _, inverse = OPERATIONS[name]
+        core = _pinned(cls, engine)()
+        for size in sizes:
+            rng = random.Random(seed + size)
+            data = rng.randbytes(size)
+            args = _arguments(name, rng)
+            if inverse is not None:
+                data = getattr(core, inverse)(data, *args)
+            with memory_profiled() as stats:
+                getattr(core, name)(data, *args)
+            report = stats.snapshot()
+            entry = report['operations'][name]
+            rows.append({
+                'operation': name, 'size': len(data), 'engine': engine or 'auto',
+                'peak_bytes': entry['peak_bytes'], 'peak_live_blocks': entry['peak_live_blocks'],
+                'peak_per_input_byte': entry['peak_per_input_byte'],
+                'stages': {stage: values['peak_bytes'] for stage, values in report['stages'].items()},
+            })
+    return rows
+
+
+def format_report(rows, stages=False):
+    """ Formats profile_sizes() rows as a text table. The stage with the
+        largest peak is shown for every row, or all of them with 'stages'. """
+    lines = ['%-18s %9s %12s %10s %11s  %s' % ('operation', 'size', 'peak bytes', 'bytes/B', 'live blocks',
+                                               'largest stage')]
+    for row in rows:
+        ranked = sorted(row['stages'].items(), key=lambda item: item[1], reverse=True)
+        top = '%s (%d)' % ranked[0] if ranked else '-'
+        per_byte = row['peak_per_input_byte']
+        lines.append('%-18s %9d %12d %10s %11d  %s' % (row['operation'], row['size'], row['peak_bytes'],
+                                                      '%.1f' % per_byte if per_byte is not None else '-',
+                                                      row['peak_live_blocks'], top))
+        if stages:
+            for stage, peak in ranked:
+                lines.append('    %-30s %12d' % (stage, peak))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report the peak memory of the DES and TDES operations.")
+    parser.add_argument("--operations", nargs="+", default=None, choices=list(OPERATIONS), metavar="NAME",
+                        help="operations to profile (default: all)")
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES, help="payload sizes in bytes")
+    parser.add_argument("--engine", default=None, choices=_IntCore._registry.names(available_only=False),
+                        help="backend to force (default: chosen by the registry)")
+    parser.add_argument("--stages", action="store_true", help="list the peak of every stage")
+    parser.add_argument("--json", action="store_true", help="print the rows as JSON")
+    args = parser.parse_args(argv)
+    rows = profile_sizes(args.operations, args.sizes, args.engine)
+    if args.json:
+        print(json.dumps(rows, indent=2, sort_keys=True))
+    else:
+        print(format_report(rows, args.stages))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
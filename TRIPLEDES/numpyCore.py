@@ -0,0 +1,79 @@
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, only engine="numpy" needs it
+    np = None
+
+from intCore import _IntCore
+
+
+class _NumpyCore(_IntCore):
+    """ Vectorized DES engine. The input is viewed as an array of 64-bit
+        blocks and every Feistel round runs over the whole array at once, with
+        the byte-indexed permutation tables and the SP tables used as
+        vectorized gathers. Only independent blocks can be processed this way.
+    """
+
+    # Blocks processed per pass, which bounds the size of the temporaries
+    CHUNK_BLOCKS = 1 << 16
+
+    def __init__(self):
+        if np is None:
+            raise ImportError("NumPy is required for engine='numpy'")
+        u64 = np.uint64
+        self._np_ip = [np.array(t, dtype=u64) for t in self._IP_TABLES]
+        self._np_fp = [np.array(t, dtype=u64) for t in self._FP_TABLES]
+        self._np_e = [np.array(t, dtype=u64) for t in self._E_TABLES]
+        self._np_sp = [np.array(t, dtype=u64) for t in self._SP_TABLES]
+        self._np_shifts = [u64(n) for n in range(64)]
+
+    def _np_permute(self, x, tables):
+        """ Permutes every element of 'x' with a list of byte-indexed tables,
+            most significant byte first. """
+        shifts = self._np_shifts
+        byte = np.uint64(0xFF)
+        top = 8 * (len(tables) - 1)
+        out = tables[0][x >> shifts[top]]
+        for i in range(1, len(tables)):
+            out |= tables[i][(x >> shifts[top - 8 * i]) & byte]
+        return out
+
+    def _np_crypt_blocks(self, blocks, stages):
+        """ Runs an array of 64-bit blocks through one DES pass per subkey list
+            in 'stages'. Consecutive passes cancel each other's FP and IP, so
+            only the halves are swapped between them.
+        """
+        shifts = self._np_shifts
+        low32 = np.uint64(0xFFFFFFFF)
+        six = np.uint64(0x3F)
+        s0, s1, s2, s3, s4, s5, s6, s7 = self._np_sp
+        e_tables = self._np_e
+        block = self._np_permute(blocks, self._np_ip)
+        left = block >> shifts[32]
+        right = block & low32
+        for subkeys in stages:
+            for key in subkeys:
+                e = self._np_permute(right, e_tables) ^ np.uint64(key)
+                f = s0[e >> shifts[42]]
+                f |= s1[(e >> shifts[36]) & six]
+                f |= s2[(e >> shifts[30]) & six]
+                f |= s3[(e >> shifts[24]) & six]
+                f |= s4[(e >> shifts[18]) & six]
+                f |= s5[(e >> shifts[12]) & six]
+                f |= s6[(e >> shifts[6]) & six]
+                f |= s7[e & six]
+                f ^= left
+                left, right = right, f
+            left, right = right, left
+        return self._np_permute((left << shifts[32]) | right, self._np_fp)
+
+    def _np_crypt(self, data, stages):
+        """ Encrypts block aligned data with one DES pass per subkey list in
+            'stages' and returns the result as bytes. """
+        if len(data) % 8 != 0:
+            raise ValueError("Data length must be a multiple of 8 bytes")
+        blocks = np.frombuffer(data, dtype='>u8').astype(np.uint64)
+        out = np.empty(len(blocks), dtype='>u8')
+        chunk = self.CHUNK_BLOCKS
+        for start in range(0, len(blocks), chunk):
+            out[start:start + chunk] = self._np_crypt_blocks(blocks[start:start + chunk], stages)
+        return out.tobytes()
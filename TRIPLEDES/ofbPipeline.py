@@ -0,0 +1,180 @@
+import queue
+import threading
+import weakref
+from collections import OrderedDict
+
+
+class KeystreamCache:
+    """ Bounded least-recently-used cache of OFB keystream per (key, IV). The
+        limit is the total number of keystream bytes held. A later request for
+        the same key and IV reuses the cached prefix and only generates the
+        part that is missing.
+    """
+
+    def __init__(self, max_bytes=1 << 24):
+        if max_bytes < 0:
+            raise ValueError("Cache size must not be negative")
+        self.max_bytes = max_bytes - max_bytes % 8
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, iv):
+        """ Returns the cached keystream for 'key' and 'iv', or b'' if there is
+            none. """
+        with self._lock:
+            keystream = self._entries.get((key, iv), b'')
+            if keystream:
+                self._entries.move_to_end((key, iv))
+            return keystream
+
+    def put(self, key, iv, keystream):
+        """ Stores keystream for 'key' and 'iv', truncated to whole blocks and
+            to the cache limit. A longer cached entry is kept. """
+        length = min(len(keystream) - len(keystream) % 8, self.max_bytes)
+        with self._lock:
+            entry = self._entries.get((key, iv), b'')
+            if length <= len(entry):
+                return
+            self._size += length - len(entry)
+            self._entries[(key, iv)] = bytes(keystream[:length])
+            self._entries.move_to_end((key, iv))
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def keystream(self, core, key, stages, iv, nbytes):
+        """ Returns at least 'nbytes' of keystream, generating with 'core' and
+            'stages' only what is not cached yet. """
+        cached = self.get(key, iv)
+        with self._lock:
+            if len(cached) >= nbytes:
+                self.hits += 1
+                return cached
+            self.misses += 1
+        feedback = cached[-8:] if cached else iv
+        keystream = cached + core._ofb_keystream(stages, feedback, (nbytes + 7) // 8 - len(cached) // 8)
+        self.put(key, iv, keystream)
+        return keystream
+
+    def clear(self):
+        """ Drops every cached keystream and resets the counters. """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """ Returns the cache statistics as a dictionary. """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries),
+                    'bytes': self._size, 'max_bytes': self.max_bytes}
+
+
+def _put(q, stop, item):
+    """ Queues an item, giving up if the pipeline is closed meanwhile. """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(q, stop, core, stages, iv, prefix, chunk_blocks):
+    """ Background thread: serves the cached prefix, then generates new
+        keystream until the pipeline is closed. It holds no reference to the
+        pipeline, so an abandoned pipeline can be collected and stop it. """
+    try:
+        chunk = 8 * chunk_blocks
+        for offset in range(0, len(prefix), chunk):
+            if not _put(q, stop, prefix[offset:offset + chunk]):
+                return
+        feedback = prefix[-8:] if prefix else iv
+        while not stop.is_set():
+            keystream = core._ofb_keystream(stages, feedback, chunk_blocks)
+            feedback = keystream[-8:]
+            if not _put(q, stop, keystream):
+                return
+    except BaseException as exc:
+        _put(q, stop, exc)
+
+
+class OFBPipeline:
+    """ XORs a stream with OFB keystream that a background thread generates
+        ahead of time into a bounded queue, so the caller only does bulk XOR
+        while the cipher runs during its I/O. Applying the keystream decrypts
+        the output of encrypt(), or encrypts data the caller has padded.
+        The thread stops on close() or when the pipeline is garbage
+        collected; if it fails, every later update() raises its error.
+    """
+
+    def __init__(self, core, stages, iv, chunk_blocks=1024, depth=4, cache=None, cache_key=None):
+        """ Parameters:
+              core         - DES or TDES object that generates the keystream
+              stages       - encryption schedule of the key
+              iv           - 64-bit initialization vector
+              chunk_blocks - keystream blocks generated per queue entry
+              depth        - number of queue entries generated ahead
+              cache        - optional KeystreamCache to read from and fill
+              cache_key    - key bytes identifying the key in the cache """
+        if chunk_blocks <= 0 or depth <= 0:
+            raise ValueError("Chunk size and depth must be positive")
+        self._core = core
+        self._iv = bytes(iv)
+        self._cache = cache
+        self._cache_key = cache_key
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._pending = b''
+        self._error = None
+        self._closed = False
+        self._record = bytearray() if cache is not None else None
+        prefix = cache.get(cache_key, self._iv) if cache is not None else b''
+        self._thread = threading.Thread(target=_produce, args=(self._queue, self._stop, core, stages, self._iv,
+                                                               prefix, chunk_blocks), daemon=True)
+        self._thread.start()
+        self._finalizer = weakref.finalize(self, self._stop.set)
+
+    def update(self, data):
+        """ XORs 'data' with the next len(data) bytes of keystream. """
+        if self._closed:
+            raise ValueError("Pipeline already closed")
+        if self._error is not None:
+            raise self._error
+        data = self._core._as_buffer(data)
+        parts = [self._pending]
+        available = len(self._pending)
+        while available < len(data):
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                # The producer has stopped; fail every later call the same way
+                self._error = item
+                raise item
+            parts.append(item)
+            available += len(item)
+        keystream = b''.join(parts)
+        self._pending = keystream[len(data):]
+        if self._record is not None and len(self._record) < self._cache.max_bytes:
+            self._record += keystream[:len(data)]
+        return self._core._xor_bytes(data, keystream)
+
+    def close(self):
+        """ Stops the background thread and stores the keystream used so far
+            in the cache, if there is one. """
+        self._closed = True
+        self._finalizer()
+        self._thread.join()
+        if self._record is not None:
+            self._cache.put(self._cache_key, self._iv, self._record)
+            self._record = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,117 @@
+import os
+
+from intCore import _IntCore
+
+DEFAULT_SHARD_SIZE = 1 << 20
+
+# Per-worker state, set once by _init_worker when the process starts
+_worker_core = None
+_worker_schedule = None
+_worker_engine = None
+
+
+def _init_worker(schedule, engine):
+    """ Stores the key schedule in the worker so it is sent only once. """
+    global _worker_core, _worker_schedule, _worker_engine
+    _worker_core = _IntCore()
+    _worker_schedule = schedule
+    _worker_engine = engine
+
+
+def _ecb_shard(shard, decrypt):
+    stages = _worker_schedule.decrypt if decrypt else _worker_schedule.encrypt
+    return _worker_core._ecb(shard, stages, _worker_engine)
+
+
+def _ctr_shard(shard, iv, start_block):
+    return _worker_core._ctr(shard, _worker_schedule.encrypt, iv, _worker_engine, start_block)
+
+
+def _cbc_decrypt_shard(shard, prev):
+    return _worker_core._cbc_decrypt(shard, _worker_schedule.decrypt, prev, _worker_engine)
+
+
+class ParallelPool:
+    """ Process pool for the block modes whose blocks are independent: ECB and
+        CTR in both directions and CBC decryption. Input is split into block
+        aligned shards, every worker keeps its own copy of the key schedule,
+        and the results are stitched back together in order. Other modes run
+        serially in the calling process.
+    """
+
+    def __init__(self, cipher, workers=None, shard_size=DEFAULT_SHARD_SIZE):
+        """ Parameters:
+              cipher     - DES or TDES object providing key, mode, IV and engine
+              workers    - number of processes, defaults to the CPU count
+              shard_size - bytes per shard, rounded down to whole blocks """
+        if shard_size < 8:
+            raise ValueError("Shard size must be at least one block")
+        self.cipher = cipher
+        self.workers = workers or os.cpu_count() or 1
+        self.shard_size = shard_size - shard_size % 8
+        # Imported here: multiprocessing is slow to import and only needed
+        # once a pool is actually created
+        from concurrent.futures import ProcessPoolExecutor
+        self._executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                             initargs=(cipher._schedule, cipher.engine))
+
+    def _shards(self, data):
+        data = self.cipher._as_buffer(data)
+        return [bytes(data[i:i + self.shard_size]) for i in range(0, len(data), self.shard_size)]
+
+    def _ecb(self, data, decrypt):
+        shards = self._shards(data)
+        if len(shards) < 2:
+            schedule = self.cipher._schedule
+            return self.cipher._ecb(data, schedule.decrypt if decrypt else schedule.encrypt, self.cipher.engine)
+        return b''.join(self._executor.map(_ecb_shard, shards, [decrypt] * len(shards)))
+
+    def _ctr(self, data):
+        cipher = self.cipher
+        cipher._check_iv(cipher.IV)
+        shards = self._shards(data)
+        if len(shards) < 2:
+            return cipher._ctr(data, cipher._schedule.encrypt, cipher.IV, cipher.engine)
+        starts = range(0, len(data) // 8 + 1, self.shard_size // 8)
+        return b''.join(self._executor.map(_ctr_shard, shards, [bytes(cipher.IV)] * len(shards), starts))
+
+    def encrypt(self, data):
+        """ Encrypts data like cipher.encrypt(), spreading ECB and CTR over the
+            pool. """
+        cipher = self.cipher
+        if cipher.mode == "CTR":
+            return self._ctr(data)
+        if cipher.mode != "ECB":
+            return cipher.encrypt(data)
+        return self._ecb(cipher._add_padding(data), False)
+
+    def decrypt(self, data):
+        """ Decrypts data like cipher.decrypt(), spreading ECB, CBC and CTR over
+            the pool. Each CBC shard only needs the ciphertext block before it
+            and each CTR shard only its first counter value. """
+        cipher = self.cipher
+        data = cipher._as_buffer(data)
+        if cipher.mode == "CTR":
+            return self._ctr(data)
+        if cipher.mode == "ECB":
+            return cipher._rem_padding(self._ecb(data, True))
+        if cipher.mode != "CBC":
+            return cipher.decrypt(data)
+        cipher._check_iv(cipher.IV)
+        if len(data) % 8 != 0:
+            raise ValueError("Data length must be a multiple of 8 bytes")
+        shards = self._shards(data)
+        if len(shards) < 2:
+            return cipher.decrypt(data)
+        prevs = [bytes(cipher.IV)] + [shard[-8:] for shard in shards[:-1]]
+        return cipher._rem_padding(b''.join(self._executor.map(_cbc_decrypt_shard, shards, prevs)))
+
+    def close(self):
+        """ Shuts the worker processes down. """
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
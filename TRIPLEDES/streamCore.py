@@ -0,0 +1,180 @@
+class _StreamContext:
+    """ Shared state of an incremental encryption or decryption. Only a
+        partial block is buffered between calls, and the CBC/OFB feedback
+        register is carried from one update() to the next.
+    """
+
+    def __init__(self, cipher, mode, schedule, iv=None, engine=None):
+        """ Parameters:
+              cipher   - the DES or TDES object whose block modes are used
+              mode     - "ECB" or "CBC" or "OFB" or "CTR"
+              schedule - precomputed key schedule of the cipher
+              iv       - 64-bit byte string, required for CBC, OFB and CTR modes
+              engine   - backend used for independent blocks """
+        if mode not in ("ECB", "CBC", "OFB", "CTR"):
+            raise ValueError("Invalid mode: " + mode)
+        self.mode = mode
+        self._cipher = cipher
+        self._schedule = schedule
+        self._iv = bytes(iv) if iv is not None else None
+        self._engine = engine
+        self._buffer = bytearray()
+        self._finalized = False
+        # Number of CTR blocks already used
+        self._block = 0
+
+    def _check_open(self):
+        if self._finalized:
+            raise ValueError("Context already finalized")
+
+    def _take(self, length):
+        """ Removes and returns the first 'length' bytes of the buffer. """
+        data = bytes(self._buffer[:length])
+        del self._buffer[:length]
+        return data
+
+    def _ofb(self, data):
+        """ XORs block aligned data with the keystream and advances the
+            feedback register to the last keystream block. """
+        out = self._cipher._ofb(data, self._schedule.encrypt, self._iv, self._engine)
+        if len(data) >= 8:
+            feedback = int.from_bytes(out[-8:], byteorder='big') ^ int.from_bytes(data[-8:], byteorder='big')
+            self._iv = feedback.to_bytes(8, byteorder='big')
+        return out
+
+    def _ctr(self, data):
+        """ XORs data with the CTR keystream following the blocks already
+            processed. """
+        out = self._cipher._ctr(data, self._schedule.encrypt, self._iv, self._engine, self._block)
+        self._block += len(data) // 8
+        return out
+
+
+class StreamEncryptor(_StreamContext):
+    """ Encrypts a message chunk by chunk. Every update() returns the
+        ciphertext of all complete blocks seen so far and finalize() pads and
+        encrypts the remainder (CTR mode does not pad), so the output matches a
+        one-shot encrypt().
+    """
+
+    def update(self, chunk):
+        """ Encrypts as many complete blocks as are available and returns the
+            ciphertext. The rest is kept until the next call. """
+        self._check_open()
+        self._buffer += self._cipher._as_buffer(chunk)
+        length = len(self._buffer) - len(self._buffer) % 8
+        if length == 0:
+            return b''
+        return self._process(self._take(length))
+
+    def finalize(self):
+        """ Pads and encrypts the buffered tail. The context cannot be used
+            afterwards. """
+        self._check_open()
+        self._finalized = True
+        if self.mode == "CTR":
+            return self._ctr(self._take(len(self._buffer)))
+        data = self._cipher._add_padding(self._take(len(self._buffer)))
+        return self._process(data)
+
+    def _process(self, data):
+        schedule = self._schedule
+        if self.mode == "ECB":
+            return self._cipher._ecb(data, schedule.encrypt, self._engine)
+        elif self.mode == "CBC":
+            out = self._cipher._cbc_encrypt(data, schedule.encrypt, self._iv, self._engine)
+            self._iv = out[-8:]
+            return out
+        elif self.mode == "CTR":
+            return self._ctr(data)
+        return self._ofb(data)
+
+
+class StreamDecryptor(_StreamContext):
+    """ Decrypts a message chunk by chunk. In ECB and CBC modes the last
+        complete block is held back until finalize(), which removes the
+        padding, so the output matches a one-shot decrypt(). A strict
+        decryptor removes the padding in OFB mode too and raises ValueError
+        unless the padding is one to eight bytes, each equal to the count.
+    """
+
+    def __init__(self, cipher, mode, schedule, iv=None, engine=None, strict=False):
+        """ Parameters as for the encryptor, and:
+              strict - True to remove and check the padding in every padded
+                       mode, e.g. when decrypting whole files """
+        super().__init__(cipher, mode, schedule, iv, engine)
+        self._strict = strict
+
+    def _unpads(self):
+        return self.mode in ("ECB", "CBC") or (self.mode == "OFB" and self._strict)
+
+    def update(self, chunk):
+        """ Decrypts as many complete blocks as can be released and returns the
+            plaintext. The rest is kept until the next call. """
+        self._check_open()
+        self._buffer += self._cipher._as_buffer(chunk)
+        if self._unpads():
+            # Keep at least one byte back so the final block is never released
+            # before its padding can be removed
+            length = max(len(self._buffer) - 1, 0) // 8 * 8
+        else:
+            length = len(self._buffer) - len(self._buffer) % 8
+        if length == 0:
+            return b''
+        return self._process(self._take(length))
+
+    def finalize(self):
+        """ Decrypts the buffered tail and, in ECB and CBC modes, removes the
+            padding. The context cannot be used afterwards. """
+        self._check_open()
+        self._finalized = True
+        data = self._take(len(self._buffer))
+        if not self._unpads():
+            if self.mode == "CTR":
+                return self._ctr(data)
+            return self._cipher._ofb(data, self._schedule.encrypt, self._iv, self._engine)
+        if len(data) != 8:
+            raise ValueError("Ciphertext length must be a multiple of 8 bytes")
+        block = self._process(data)
+        if self._strict and not (1 <= block[-1] <= 8 and block[-block[-1]:] == bytes([block[-1]]) * block[-1]):
+            raise ValueError("Invalid padding: wrong key or IV, or corrupt ciphertext")
+        return self._cipher._rem_padding(block)
+
+    def _process(self, data):
+        schedule = self._schedule
+        if self.mode == "ECB":
+            return self._cipher._ecb(data, schedule.decrypt, self._engine)
+        elif self.mode == "CBC":
+            out = self._cipher._cbc_decrypt(data, schedule.decrypt, self._iv, self._engine)
+            self._iv = data[-8:]
+            return out
+        elif self.mode == "CTR":
+            return self._ctr(data)
+        return self._ofb(data)
+
+
+def crypt_into(context, src, dst, chunk_size=1 << 16):
+    """ Runs 'src' through a streaming context in 'chunk_size' pieces and
+        writes the output straight into the writable buffer 'dst', returning
+        the number of bytes written. Every piece is read before its output is
+        written and output never runs ahead of input, so 'dst' may be the same
+        memory as 'src' to work in place.
+    """
+    src = context._cipher._as_buffer(src)
+    view = memoryview(dst)
+    if view.readonly:
+        raise TypeError("Destination buffer must be writable")
+    view = view.cast('B') if view.format != 'B' or view.ndim != 1 else view
+    pos = 0
+
+    def write(out):
+        nonlocal pos
+        if pos + len(out) > len(view):
+            raise ValueError("Destination buffer is too small")
+        view[pos:pos + len(out)] = out
+        pos += len(out)
+
+    for offset in range(0, len(src), chunk_size):
+        write(context.update(src[offset:offset + chunk_size]))
+    write(context.finalize())
+    return pos
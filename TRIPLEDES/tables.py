@@ -0,0 +1,203 @@
+""" Derived DES tables persisted to disk.
+
+    The integer engine needs tables derived from the raw lists in _Core:
+    byte-indexed IP/FP/E/PC-1/PC-2 tables and the SP tables. Deriving them
+    takes far longer than loading them, so they are written once to a
+    versioned, checksummed binary file in the user's cache directory and read
+    back in one call. A missing, stale or corrupt file is rebuilt on the
+    next import. The file holds integer tables only, never code.
+
+        python tables.py [path]    # (re)generate the table file
+"""
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from core import _Core
+
+TABLES_VERSION = 2
+MAGIC = b'CUIDESTB'
+
+# magic, version, byte order, CRC-32 of the source tables, CRC-32 of the body
+_HEADER = struct.Struct('<8sH1sII')
+# name, rows, offset into the body, length in bytes of a table of 64-bit rows
+_ENTRY = struct.Struct('<16sHII')
+
+# Rows and columns of every table, checked when the file is read
+_SHAPES = {'ip': (8, 256), 'fp': (8, 256), 'e': (4, 256), 'pc1': (8, 256), 'pc2': (7, 256), 'sp': (8, 64)}
+
+
+def default_path():
+    """ Returns the table file location: CUI_DES_TABLES if set, otherwise
+        cui_des/des_tables.bin in $XDG_CACHE_HOME or ~/.cache, so importing
+        never writes into the package directory. """
+    path = os.environ.get('CUI_DES_TABLES')
+    if path:
+        return path
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache, 'cui_des', 'des_tables.bin')
+
+
+def _source_crc():
+    """ CRC-32 of the raw _Core tables, so editing them invalidates the file. """
+    source = (_Core.INIT_PERMUTATION, _Core.FINAL_PERMUTATION, _Core._EXPAND, _Core._CONTRACT,
+              _Core._KEY_PERMUTATION1, _Core._KEY_PERMUTATION2, _Core._S_BOXES)
+    return zlib.crc32(repr(source).encode('ascii'))
+
+
+def _header_fields():
+    return MAGIC, TABLES_VERSION, b'<' if sys.byteorder == 'little' else b'>', _source_crc()
+
+
+def _permute_int(value, table, width):
+    """ Permutes the bits of an integer using a DES permutation table. Bit
+        positions in the table are counted from the most significant bit of a
+        'width'-bit input, exactly like the list-of-bits tables in _Core.
+    """
+    result = 0
+    out_width = len(table)
+    for i, src in enumerate(table):
+        if (value >> (width - 1 - src)) & 1:
+            result |= 1 << (out_width - 1 - i)
+    return result
+
+
+def _byte_tables(table, width):
+    """ Splits a permutation of a 'width'-bit input into one 256-entry table per
+        input byte. The permuted value is the OR of the entries selected by
+        each byte of the input, most significant byte first.
+    """
+    tables = []
+    for pos in range(width // 8):
+        shift = width - 8 * (pos + 1)
+        tables.append([_permute_int(v << shift, table, width) for v in range(256)])
+    return tables
+
+
+def _sp_tables():
+    """ Builds the eight 64-entry SP tables. Each entry is the output of one
+        S-BOX for a 6-bit input, already placed in its nibble of the 32-bit
+        result and run through the _CONTRACT permutation.
+    """
+    tables = []
+    for i, box in enumerate(_Core._S_BOXES):
+        entries = []
+        for six in range(64):
+            row = ((six >> 4) & 2) | (six & 1)
+            col = (six >> 1) & 15
+            entries.append(_permute_int(box[row][col] << (28 - 4 * i), _Core._CONTRACT, 32))
+        tables.append(entries)
+    return tables
+
+
+def build_tables():
+    """ Derives every table from the raw _Core lists. Returns a dictionary of
+        lists of integer rows. """
+    return {
+        'ip': _byte_tables(_Core.INIT_PERMUTATION, 64),
+        'fp': _byte_tables(_Core.FINAL_PERMUTATION, 64),
+        'e': _byte_tables(_Core._EXPAND, 32),
+        'pc1': _byte_tables(_Core._KEY_PERMUTATION1, 64),
+        'pc2': _byte_tables(_Core._KEY_PERMUTATION2, 56),
+        'sp': _sp_tables(),
+    }
+
+
+def write_tables(path=None, tables=None):
+    """ Writes the derived tables to 'path' and returns the path. The file is
+        written to a temporary name and renamed, so readers never see a
+        partial file. """
+    path = path or default_path()
+    tables = tables or build_tables()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    entries, chunks, offset = [], [], 0
+    for name, value in tables.items():
+        flat = [v for row in value for v in row]
+        data = struct.pack('=%dQ' % len(flat), *flat)
+        entries.append(_ENTRY.pack(name.encode('ascii'), len(value), offset, len(data)))
+        chunks.append(data)
+        offset += len(data)
+    body = struct.pack('<I', len(entries)) + b''.join(entries) + b''.join(chunks)
+    magic, version, order, source_crc = _header_fields()
+    header = _HEADER.pack(magic, version, order, source_crc, zlib.crc32(body))
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(header + body)
+    os.replace(tmp, path)
+    return path
+
+
+def _parse(data):
+    """ Parses and verifies the contents of a table file. Returns the tables
+        as tuples of tuples, or None if the file is from another version or
+        platform, was built from other source tables, fails its checksum or
+        does not hold the expected tables. """
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, order, source_crc, body_crc = _HEADER.unpack_from(data)
+    if (magic, version, order, source_crc) != _header_fields():
+        return None
+    body = data[_HEADER.size:]
+    if zlib.crc32(body) != body_crc:
+        return None
+    count, = struct.unpack_from('<I', body)
+    start = 4 + count * _ENTRY.size
+    tables = {}
+    for i in range(count):
+        name, rows, offset, length = _ENTRY.unpack_from(body, 4 + i * _ENTRY.size)
+        name = name.rstrip(b'\0').decode('ascii')
+        if _SHAPES.get(name, (None, None))[0] != rows or length != 8 * rows * _SHAPES[name][1]:
+            return None
+        flat = array('Q', body[start + offset:start + offset + length])
+        width = _SHAPES[name][1]
+        if len(flat) != rows * width:
+            return None
+        tables[name] = tuple(tuple(flat[r * width:(r + 1) * width]) for r in range(rows))
+    if set(tables) != set(_SHAPES):
+        return None
+    return tables
+
+
+def _freeze(tables):
+    """ Turns every table into a tuple of tuples. The tables are shared by
+        every cipher object and context, so they must not be mutable. """
+    return {name: tuple(tuple(row) for row in value) for name, value in tables.items()}
+
+
+def load_tables(path=None):
+    """ Reads the derived tables from 'path', rebuilding the file if it is
+        missing or invalid, and returns them as immutable tuples. If the
+        file cannot be written (e.g. no writable cache directory) the tables
+        are derived in memory. """
+    path = path or default_path()
+    try:
+        with open(path, 'rb') as f:
+            tables = _parse(f.read())
+    except (OSError, ValueError, TypeError, struct.error):
+        tables = None
+    if tables is None:
+        tables = _freeze(build_tables())
+        try:
+            write_tables(path, tables)
+        except OSError:
+            pass
+    return tables
+
+
+_loaded = None
+
+
+def get_tables():
+    """ Returns the tables, loading them on first use. """
+    global _loaded
+    if _loaded is None:
+        _loaded = load_tables()
+    return _loaded
+
+
+if __name__ == '__main__':
+    print(write_tables(sys.argv[1] if len(sys.argv) > 1 else None))